@@ -1,166 +1,123 @@
 import os
-from flask import Flask, request, redirect, session, make_response, render_template_string
-from datetime import datetime
-import sqlite3
-import csv
-import io
-from fpdf import FPDF
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from flask import Flask, Response, request, redirect, session, make_response, render_template, jsonify
+from datetime import date, datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
+import db
+import cartas
+import exportar
+import metricas
+import ocupacion
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'super_secreto_laboratorio')
 
-# --- CONFIGURACIÓN BASE DE DATOS ---
-# En Render, usaremos un archivo local por ahora.
-# OJO: En la versión gratuita de Render, si la app se reinicia, este archivo se borra.
-# Para producción real, más adelante conectaremos una base de datos PostgreSQL externa.
-DB_PATH = 'laboratorio_politico.db'
+TIPOS_ACTIVIDAD = ["Clase Regular", "Conferencia", "Seminario", "Taller", "Curso / Capacitación", "Consejo de Carrera", "Defensa de Tesis / Grado", "Entrevista", "Grabación de Video", "Podcast", "Reunión de Investigación", "Debate / Simulación", "Otro"]
+ESTADOS = ["Pendiente", "Aprobada", "Rechazada"]
 
 # --- SEGURIDAD ---
 PASSWORD_HASH = generate_password_hash("admin123")
 
-# --- HTML HEADER & FOOTER ---
-HTML_HEAD = """
-<!doctype html>
-<html lang="es">
-<head>
-  <meta charset="utf-8" />
-  <meta name="viewport" content="width=device-width, initial-scale=1, maximum-scale=1" />
-  <title>Reserva Lab - Ciencia Política</title>
-  <script src="https://cdn.tailwindcss.com"></script>
-  <script>
-    tailwind.config = {
-      theme: { 
-        extend: { 
-            fontFamily: { sans: ["Inter","sans-serif"] },
-            colors: { uagrm: { 700: '#004c8c', 800: '#003366' } } 
-        } 
-      }
-    }
-  </script>
-  <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700;800&display=swap" rel="stylesheet">
-</head>
-<body class="bg-slate-50 text-slate-800 font-sans leading-relaxed">
-  <div class="h-1.5 w-full bg-gradient-to-r from-red-700 via-yellow-500 to-green-700"></div>
-  <header class="sticky top-0 z-30 bg-white/95 backdrop-blur border-b border-slate-200 shadow-sm">
-    <div class="max-w-7xl mx-auto px-4 py-3 flex flex-wrap items-center justify-between gap-3">
-      <a href="/reservalab" class="flex items-center gap-3">
-        <img src="https://i.imgur.com/ldeXZmG.png" alt="Logo" class="h-10 w-10 object-contain" />
-        <div class="leading-tight">
-          <p class="text-[10px] uppercase tracking-wider text-slate-500 font-semibold">UAGRM</p>
-          <h1 class="font-bold text-sm sm:text-base text-slate-900 leading-tight">Ciencia Política y<br>Administración Pública</h1>
-        </div>
-      </a>
-      <nav class="flex items-center gap-4 text-sm font-medium ml-auto">
-        <a href="/reservalab" class="hover:text-uagrm-700 transition">Inicio</a>
-        {% if session.get('admin_logueado') %}
-            <a href="/admin" class="text-emerald-700 font-bold">Admin</a>
-            <a href="/logout" class="text-rose-600">Salir</a>
-        {% else %}
-            <a href="/login" class="text-slate-500 hover:text-uagrm-700 transition">Director</a>
-        {% endif %}
-      </nav>
-    </div>
-  </header>
-  <main class="min-h-screen pb-12">
-"""
-
-HTML_FOOTER = """
-  </main>
-  <footer class="border-t border-slate-200 bg-white py-8 text-center text-sm text-slate-500">
-    <p>© 2026 Carrera de Ciencia Política y Administración Pública — UAGRM.</p>
-  </footer>
-</body>
-</html>
-"""
-
-# --- BASE DE DATOS ---
-def inicializar_db():
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS reservas_laboratorio (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nombre TEXT NOT NULL,
-                registro TEXT NOT NULL,
-                ci TEXT NOT NULL,
-                celular TEXT NOT NULL,
-                email TEXT NOT NULL,
-                responsable_actividad TEXT,
-                tipo_actividad TEXT NOT NULL,
-                objetivo TEXT NOT NULL,
-                fecha TEXT NOT NULL,
-                hora_inicio TEXT NOT NULL,
-                hora_fin TEXT NOT NULL,
-                participantes INTEGER NOT NULL,
-                estado TEXT DEFAULT 'Pendiente'
-            )
-        ''')
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        print(f"Error DB: {e}")
+# --- PLANTILLAS ---
+# Las páginas viven en templates/ y heredan de base.html. Se compilan una sola
+# vez al arrancar; en cada petición Jinja solo renderiza.
+app.jinja_env.auto_reload = False
+for _plantilla in app.jinja_env.list_templates(): app.jinja_env.get_template(_plantilla)
+
+# --- MÉTRICAS ---
+# Solo con METRICAS=1. /metrics acepta la sesión del director o, para el
+# recolector de Prometheus, el encabezado "Authorization: Bearer <METRICAS_TOKEN>".
+metricas.instalar(app)
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN')
 
 # Inicializamos al arrancar
-inicializar_db()
+db.inicializar_db()
 
 # --- LÓGICA ---
 def hay_cruce_de_horario(fecha, inicio, fin):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT id FROM reservas_laboratorio WHERE fecha = ? AND (hora_inicio < ? AND hora_fin > ?) AND estado != "Rechazada"', (fecha, fin, inicio))
-    res = cursor.fetchone()
-    conn.close()
-    return res is not None
-
-# --- PDF ---
-class PDF(FPDF): pass
-def crear_carta_pdf(datos):
-    pdf = PDF()
-    pdf.add_page(); pdf.set_margins(25, 25, 25)
-    def txt(t): return t.encode('latin-1', 'replace').decode('latin-1')
-    
-    fecha_actual = datetime.now().strftime("%d de %B de %Y")
-    meses = {"January":"Enero","February":"Febrero","March":"Marzo","April":"Abril","May":"Mayo","June":"Junio","July":"Julio","August":"Agosto","September":"Septiembre","October":"Octubre","November":"Noviembre","December":"Diciembre"}
-    for en, es in meses.items(): fecha_actual = fecha_actual.replace(en, es)
-
-    pdf.set_font('Arial', '', 11)
-    pdf.cell(0, 10, txt(f"Santa Cruz de la Sierra, {fecha_actual}"), 0, 1, 'R'); pdf.ln(5)
-    
-    pdf.set_font('Arial', 'B', 11)
-    pdf.cell(0, 5, txt("Señor:"), 0, 1)
-    pdf.cell(0, 5, txt("M.Sc. Odin Rodriguez Mercado"), 0, 1)
-    pdf.set_font('Arial', '', 11)
-    pdf.cell(0, 5, txt("DIRECTOR DE CARRERA"), 0, 1)
-    pdf.cell(0, 5, txt("CIENCIA POLÍTICA Y ADM. PÚBLICA - UAGRM"), 0, 1)
-    pdf.set_font('Arial', 'B', 11)
-    pdf.cell(0, 5, txt("Presente.-"), 0, 1); pdf.ln(10)
-    
-    pdf.set_font('Arial', 'B', 12)
-    pdf.cell(0, 10, txt("Ref.: SOLICITUD DE USO DE LABORATORIO"), 0, 1, 'R'); pdf.ln(5)
-    pdf.set_font('Arial', '', 12)
-    cuerpo = f"""De mi mayor consideración:
-
-Mediante la presente, yo, {datos['nombre']}, con Registro Universitario N° {datos['registro']} y C.I. {datos['ci']}, solicito a su autoridad la autorización para el uso del Laboratorio de Análisis Político.
-
-La actividad a realizar es "{datos['tipo_actividad']}" con el siguiente propósito: {datos['objetivo']}.
-
-Detalles:
-- Fecha: {datos['fecha']}
-- Horario: De {datos['hora_inicio']} a {datos['hora_fin']}
-- Participantes: {datos['participantes']}
-
-Me comprometo a hacer un uso responsable de los equipos e instalaciones.
-
-Sin otro particular, me despido atentamente."""
-    pdf.multi_cell(0, 7, txt(cuerpo)); pdf.ln(30)
-    
-    pdf.set_font('Arial', '', 11)
-    pdf.cell(0, 5, "____________________________________", 0, 1, 'C')
-    pdf.cell(0, 5, txt(datos['nombre']), 0, 1, 'C')
-    pdf.cell(0, 5, txt(f"C.I.: {datos['ci']}"), 0, 1, 'C')
-    return pdf.output(dest='S').encode('latin-1')
+    return db.hay_cruce(fecha, inicio, fin)
+
+# --- CALENDARIO ---
+CALENDARIO_POR_PAGINA = 20
+ADMIN_POR_PAGINA = 25
+VENTANAS = {'proximas': 'Próximas', 'semana': 'Esta semana', 'mes': 'Este mes'}
+
+def rango_ventana(ventana):
+    hoy = datetime.now().date()
+    if ventana == 'semana':
+        lunes = hoy - timedelta(days=hoy.weekday())
+        return lunes.isoformat(), (lunes + timedelta(days=6)).isoformat()
+    if ventana == 'mes':
+        siguiente = (hoy.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return hoy.replace(day=1).isoformat(), (siguiente - timedelta(days=1)).isoformat()
+    return hoy.isoformat(), None
+
+# La clave de paginación viaja como "fecha|hora_inicio|id".
+def clave_a_texto(clave):
+    return '|'.join(map(str, clave)) if clave else None
+
+def texto_a_clave(texto):
+    if not texto: return None
+    fecha, hora, id_ = texto.split('|')
+    return fecha, hora, int(id_)
+
+def pagina_calendario_ventana():
+    ventana = request.args.get('ventana')
+    return ventana if ventana in VENTANAS else 'proximas'
+
+def pagina_calendario(ventana, despues=None):
+    if ventana not in VENTANAS: ventana = 'proximas'
+    desde, hasta = rango_ventana(ventana)
+    reservas, siguiente = db.listar_calendario(desde, hasta, despues, CALENDARIO_POR_PAGINA)
+    return ventana, reservas, clave_a_texto(siguiente)
+
+# --- CACHÉ DEL CALENDARIO ---
+# La página pública se lee mucho más de lo que se reserva. Lo renderizado se
+# guarda en memoria con la versión de datos (que suben los triggers en cada
+# reserva o aprobación) y el día de hoy dentro de la clave: cualquier cambio
+# produce una clave nueva y las viejas salen por TTL o por LRU. La misma clave
+# hace de ETag, así el navegador recibe 304 si nada cambió.
+class CacheTTL:
+    def __init__(self, max_entradas=256, ttl=300):
+        self.max_entradas, self.ttl = max_entradas, ttl
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave, generar):
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada and entrada[0] > ahora:
+                self._datos.move_to_end(clave)
+                return entrada[1]
+        valor = generar()
+        with self._lock:
+            self._datos[clave] = (ahora + self.ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas: self._datos.popitem(last=False)
+        return valor
+
+cache_calendario = CacheTTL()
+
+# `generar()` devuelve (cuerpo, mimetype) y solo se llama si hace falta. Solo
+# se atiende If-None-Match: el ETag sale de la clave completa (versión de
+# datos, día, ventana, sesión), mientras que una fecha de modificación tiene
+# resolución de segundos y no distingue esas variantes.
+def respuesta_condicional(clave, generar):
+    clave = clave + (db.version_datos(), datetime.now().date(), bool(session.get('admin_logueado')))
+    etag = hashlib.sha1(repr(clave).encode()).hexdigest()[:20]
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        cuerpo, tipo = cache_calendario.obtener(clave, generar)
+        response = make_response(cuerpo); response.mimetype = tipo
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Cookie')
+    return response
 
 # --- RUTAS ---
 @app.route('/')
@@ -169,108 +126,40 @@ def home_redirect():
 
 @app.route('/reservalab')
 def index():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT id, nombre, tipo_actividad, fecha, hora_inicio, hora_fin, estado FROM reservas_laboratorio WHERE estado != "Rechazada" ORDER BY fecha DESC, hora_inicio ASC')
-    reservas = cursor.fetchall()
-    conn.close()
-
-    content = """
-    <div class="max-w-6xl mx-auto px-4 sm:px-6 pt-8">
-        <div class="bg-white rounded-2xl p-6 sm:p-8 shadow-sm border border-slate-200 mb-8">
-            <h2 class="text-2xl sm:text-3xl font-extrabold text-slate-900 text-center mb-6">
-                Formulario de solicitud del Laboratorio de Análisis Político
-            </h2>
-            <div class="text-sm text-slate-600 space-y-3 bg-slate-50 p-5 rounded-xl border border-slate-100 text-justify">
-                <p><strong>Este formulario tiene como finalidad gestionar y autorizar el uso de las instalaciones y recursos tecnológicos.</strong></p>
-                <ul class="list-disc pl-5 space-y-1">
-                    <li>Solicitar con <span class="text-rose-600 font-bold">72 horas de anticipación</span>.</li>
-                    <li>Sujeto a aprobación de la Dirección de Carrera.</li>
-                </ul>
-            </div>
-        </div>
-
-        <div class="grid lg:grid-cols-12 gap-8">
-            <div class="lg:col-span-7">
-                <div class="bg-white rounded-2xl shadow-lg border border-slate-200 overflow-hidden">
-                    <div class="bg-slate-900 px-6 py-4"><h3 class="text-white font-bold text-lg">Información Requerida</h3></div>
-                    <form action="/reservar" method="POST" class="p-6 space-y-5">
-                        <div class="grid grid-cols-1 sm:grid-cols-2 gap-4">
-                            <div class="col-span-1 sm:col-span-2"><label class="lbl">Nombre Completo</label><input type="text" name="nombre" required class="inp"></div>
-                            <div><label class="lbl">Registro</label><input type="text" name="registro" required class="inp"></div>
-                            <div><label class="lbl">C.I.</label><input type="text" name="ci" required class="inp"></div>
-                            <div><label class="lbl">Celular</label><input type="tel" name="celular" required class="inp"></div>
-                            <div><label class="lbl">Correo</label><input type="email" name="email" required class="inp"></div>
-                        </div>
-                        <div class="border-t border-slate-100 pt-4 space-y-4">
-                            <div><label class="lbl">Responsable (si es distinto)</label><input type="text" name="responsable_actividad" placeholder="Opcional" class="inp"></div>
-                            <div class="grid grid-cols-1 sm:grid-cols-2 gap-4">
-                                <div>
-                                    <label class="lbl">Tipo de actividad</label>
-                                    <select name="tipo_actividad" class="inp">
-                                        <option value="" disabled selected>Seleccione...</option>
-                                        <option>Clase Regular</option>
-                                        <option>Conferencia</option>
-                                        <option>Seminario</option>
-                                        <option>Taller</option>
-                                        <option>Curso / Capacitación</option>
-                                        <option>Consejo de Carrera</option>
-                                        <option>Defensa de Tesis / Grado</option>
-                                        <option>Entrevista</option>
-                                        <option>Grabación de Video</option>
-                                        <option>Podcast</option>
-                                        <option>Reunión de Investigación</option>
-                                        <option>Debate / Simulación</option>
-                                        <option>Otro</option>
-                                    </select>
-                                </div>
-                                <div><label class="lbl">Participantes</label><input type="number" name="participantes" required class="inp"></div>
-                            </div>
-                            <div><label class="lbl">Objetivo / Propósito</label><textarea name="objetivo" rows="2" required class="inp"></textarea></div>
-                        </div>
-                        <div class="bg-indigo-50 p-4 rounded-xl border border-indigo-100">
-                            <label class="lbl text-indigo-800">Fecha y Horario</label>
-                            <input type="date" name="fecha" required class="inp mb-2 border-indigo-200">
-                            <div class="flex gap-2">
-                                <input type="time" name="inicio" required class="inp border-indigo-200"><span class="self-center font-bold text-indigo-400">a</span><input type="time" name="fin" required class="inp border-indigo-200">
-                            </div>
-                        </div>
-                        <div class="flex gap-3 pt-2">
-                            <input type="checkbox" required id="c" class="mt-1"><label for="c" class="text-xs text-slate-600">Me comprometo a hacer un uso responsable de los equipos.</label>
-                        </div>
-                        <button type="submit" class="w-full py-3.5 bg-slate-900 text-white font-bold rounded-xl shadow-lg hover:bg-slate-800 transition">Enviar Solicitud</button>
-                    </form>
-                </div>
-            </div>
-
-            <div class="lg:col-span-5">
-                <div class="bg-white rounded-2xl shadow-md border border-slate-200 overflow-hidden sticky top-24">
-                    <div class="px-6 py-4 border-b border-slate-100 bg-slate-50"><h3 class="font-bold text-slate-800">Calendario de Ocupación</h3></div>
-                    <div class="overflow-x-auto">
-                        <table class="min-w-full text-left text-xs sm:text-sm">
-                            <thead class="bg-slate-50 text-slate-500 uppercase font-bold"><tr><th class="px-4 py-3">Actividad</th><th class="px-4 py-3">Fecha</th><th class="px-4 py-3">Carta</th></tr></thead>
-                            <tbody class="divide-y divide-slate-100">
-                                {% for r in reservas %}
-                                <tr class="hover:bg-slate-50 transition">
-                                    <td class="px-4 py-3">
-                                        <p class="font-bold text-slate-900 truncate max-w-[120px]">{{ r[2] }}</p>
-                                        <p class="text-xs text-slate-500">{{ r[1] }}</p>
-                                        <span class="px-2 py-0.5 rounded-full text-[10px] font-bold {{ 'bg-amber-100 text-amber-700' if r[6]=='Pendiente' else 'bg-emerald-100 text-emerald-700' }}">{{ r[6] }}</span>
-                                    </td>
-                                    <td class="px-4 py-3 text-slate-600 whitespace-nowrap">{{ r[3] }}<br>{{ r[4] }} - {{ r[5] }}</td>
-                                    <td class="px-4 py-3"><a href="/descargar_carta/{{ r[0] }}" class="w-8 h-8 flex items-center justify-center rounded-full bg-slate-100 hover:bg-slate-200">📄</a></td>
-                                </tr>
-                                {% else %}<tr><td colspan="3" class="px-4 py-8 text-center text-slate-400">Sin reservas.</td></tr>{% endfor %}
-                            </tbody>
-                        </table>
-                    </div>
-                </div>
-            </div>
-        </div>
-    </div>
-    <style>.lbl{display:block; font-size:0.75rem; font-weight:700; color:#64748b; text-transform:uppercase; margin-bottom:0.25rem;} .inp{width:100%; border-radius:0.5rem; border:1px solid #cbd5e1; font-size:0.875rem; padding:0.625rem;}</style>
-    """
-    return render_template_string(HTML_HEAD + content + HTML_FOOTER, reservas=reservas, session=session)
+    def generar():
+        ventana, reservas, siguiente = pagina_calendario(request.args.get('ventana'))
+        return render_template('reservalab.html', tipos=TIPOS_ACTIVIDAD, reservas=reservas, ventana=ventana, ventanas=VENTANAS, siguiente=siguiente), 'text/html'
+    return respuesta_condicional(('reservalab', pagina_calendario_ventana()), generar)
+
+@app.route('/api/calendario')
+def api_calendario():
+    try: despues = texto_a_clave(request.args.get('despues'))
+    except ValueError: return "Cursor inválido", 400
+    def generar():
+        ventana, reservas, siguiente = pagina_calendario(request.args.get('ventana'), despues)
+        return app.json.dumps({'ventana': ventana, 'reservas': [dict(r) for r in reservas], 'siguiente': siguiente}), 'application/json'
+    return respuesta_condicional(('api', pagina_calendario_ventana(), despues), generar)
+
+# Horarios libres de un día (?fecha=) o de un rango (?desde=&hasta=, hasta
+# DISPONIBILIDAD_MAX_DIAS días). `ocupado` y `libres` son exactos; `mapa` es el
+# mapa de ocupación en hexadecimal (bit i = franja de 15 minutos que empieza en
+# i*15), conservador y pensado solo para dibujar.
+DISPONIBILIDAD_MAX_DIAS = 92
+
+@app.route('/disponibilidad')
+def disponibilidad():
+    a = request.args
+    # Fechas ISO estrictas y normalizadas: el índice y el BETWEEN comparan texto.
+    try: desde, hasta = (date.fromisoformat(a.get(k) or a.get('fecha')).isoformat() for k in ('desde', 'hasta'))
+    except (TypeError, ValueError): return "Fecha inválida", 400
+    if not 0 <= (date.fromisoformat(hasta) - date.fromisoformat(desde)).days < DISPONIBILIDAD_MAX_DIAS: return "Rango inválido", 400
+    def generar():
+        dias = db.ocupacion(desde, hasta)
+        return app.json.dumps({
+            'minutos_franja': ocupacion.MINUTOS_FRANJA,
+            'dias': {f: {'mapa': format(m, 'x'), 'ocupado': o, 'libres': ocupacion.horarios_libres(o)} for f, (m, o) in dias.items()},
+        }), 'application/json'
+    return respuesta_condicional(('disponibilidad', desde, hasta), generar)
 
 @app.route('/reservar', methods=['POST'])
 def reservar():
@@ -279,38 +168,40 @@ def reservar():
     resp = d.get('responsable_actividad') or nombre
     tipo, obj, fecha, ini, fin, part = d['tipo_actividad'], d['objetivo'], d['fecha'], d['inicio'], d['fin'], d['participantes']
 
-    dias = (datetime.strptime(fecha, '%Y-%m-%d').date() - datetime.now().date()).days
+    # Formatos estrictos (AAAA-MM-DD, HH:MM): el índice de ocupación y las
+    # consultas comparan estos valores como texto.
+    try:
+        dia = date.fromisoformat(fecha)
+        if dia.isoformat() != fecha or any(datetime.strptime(h, '%H:%M').strftime('%H:%M') != h for h in (ini, fin)): raise ValueError
+    except ValueError:
+        return "<script>alert('Fecha u horario inválido.'); window.history.back();</script>", 400
+    dias = (dia - datetime.now().date()).days
     if dias < 3: return "<script>alert('Error: 72 hrs de anticipación requeridas.'); window.history.back();</script>"
     if ini >= fin: return "<script>alert('Error en horario.'); window.history.back();</script>"
     if hay_cruce_de_horario(fecha, ini, fin): return "<script>alert('Horario ocupado.'); window.history.back();</script>"
 
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute('''INSERT INTO reservas_laboratorio (nombre, registro, ci, celular, email, responsable_actividad, tipo_actividad, objetivo, fecha, hora_inicio, hora_fin, participantes) VALUES (?,?,?,?,?,?,?,?,?,?,?,?)''', 
-                (nombre, registro, ci, celular, email, resp, tipo, obj, fecha, ini, fin, part))
-    nid = cur.lastrowid
-    conn.commit(); conn.close()
-    
-    msg = f"""
-    <div class="min-h-[60vh] flex items-center justify-center p-4">
-        <div class="bg-white rounded-2xl shadow-xl p-8 max-w-lg w-full text-center border border-emerald-100">
-            <h2 class="text-2xl font-bold text-slate-900 mb-2">¡Solicitud Recibida!</h2>
-            <p class="text-slate-600 mb-6">Descargue la carta y preséntela.</p>
-            <a href="/descargar_carta/{nid}" class="block w-full py-3 bg-slate-900 text-white font-bold rounded-xl shadow-lg mb-3">📥 Descargar Carta (PDF)</a>
-            <a href="/reservalab" class="block w-full py-3 border border-slate-300 text-slate-700 font-bold rounded-xl">Volver al Inicio</a>
-        </div>
-    </div>"""
-    return render_template_string(HTML_HEAD + msg + HTML_FOOTER, session=session)
+    # El control de arriba no bloquea; el definitivo se repite dentro de la transacción de escritura.
+    nid = db.reservar_si_libre((nombre, registro, ci, celular, email, resp, tipo, obj, fecha, ini, fin, part))
+    if nid is None: return "<script>alert('Horario ocupado.'); window.history.back();</script>"
+    # Desde la fila guardada, igual que en /descargar_carta, para que la clave coincida.
+    cartas.pregenerar(cartas.datos_carta(db.obtener_reserva(nid)))
+
+    return render_template('reserva_recibida.html', nid=nid)
 
 @app.route('/descargar_carta/<int:id_reserva>')
 def descargar_carta(id_reserva):
-    conn = sqlite3.connect(DB_PATH); cur = conn.cursor()
-    cur.execute("SELECT * FROM reservas_laboratorio WHERE id = ?", (id_reserva,))
-    res = cur.fetchone(); conn.close()
+    res = db.obtener_reserva(id_reserva)
     if not res: return "No encontrado", 404
-    datos = {'nombre': res[1], 'registro': res[2], 'ci': res[3], 'tipo_actividad': res[7], 'objetivo': res[8], 'fecha': res[9], 'hora_inicio': res[10], 'hora_fin': res[11], 'participantes': res[12]}
-    
-    response = make_response(crear_carta_pdf(datos))
+    datos = cartas.datos_carta(res)
+
+    # La clave de la caché sirve de ETag: si el navegador ya tiene esta carta, 304.
+    clave = cartas.clave_carta(datos)
+    if clave in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        response = make_response(cartas.cache.carta(datos, clave))
+    response.set_etag(clave)
+    response.headers['Cache-Control'] = 'private, no-cache'
     response.headers['Content-Type'] = 'application/pdf'
     response.headers['Content-Disposition'] = f'inline; filename=Carta_{id_reserva}.pdf'
     return response
@@ -322,32 +213,70 @@ def login():
             session['admin_logueado'] = True
             return redirect('/admin')
         return "<script>alert('Error'); history.back();</script>"
-    return render_template_string(HTML_HEAD + """<div class="flex justify-center pt-20"><div class="w-full max-w-sm bg-white p-8 rounded-xl shadow-lg"><h2 class="text-xl font-bold text-center mb-6">Acceso Director</h2><form method="POST" class="space-y-4"><input type="password" name="password" placeholder="Contraseña" class="w-full p-3 border rounded-lg"><button class="w-full py-3 bg-slate-900 text-white font-bold rounded-lg">Entrar</button></form></div></div>""" + HTML_FOOTER, session=session)
+    return render_template('login.html')
 
 @app.route('/admin')
 def admin_panel():
     if not session.get('admin_logueado'): return redirect('/login')
-    conn = sqlite3.connect(DB_PATH); cur = conn.cursor()
-    cur.execute("SELECT id, nombre, tipo_actividad, objetivo, fecha, hora_inicio, hora_fin, participantes FROM reservas_laboratorio WHERE estado='Pendiente'")
-    pendientes = cur.fetchall(); conn.close()
-    
-    content = """<div class="max-w-4xl mx-auto pt-8 px-4"><div class="flex justify-between mb-6"><h2 class="text-2xl font-bold">Pendientes</h2><a href="/descargar_reporte" class="bg-emerald-600 text-white px-4 py-2 rounded-lg font-bold">Excel</a></div><div class="bg-white rounded-xl shadow overflow-hidden"><ul>{% for p in pendientes %}<li class="p-4 border-b hover:bg-slate-50 flex justify-between gap-4"><div><p class="font-bold">{{ p[1] }}</p><p class="text-sm text-slate-600">{{ p[2] }} ({{ p[4] }} {{ p[5] }}-{{ p[6] }})</p></div><form action="/procesar_reserva" method="POST" class="flex gap-2"><input type="hidden" name="id" value="{{ p[0] }}"><button name="accion" value="Aprobar" class="bg-emerald-100 text-emerald-700 px-3 py-1 rounded font-bold">✔</button><button name="accion" value="Rechazar" class="bg-rose-100 text-rose-700 px-3 py-1 rounded font-bold">✖</button></form></li>{% else %}<li class="p-8 text-center text-slate-400">Sin pendientes</li>{% endfor %}</ul></div></div>"""
-    return render_template_string(HTML_HEAD + content + HTML_FOOTER, session=session)
+    a = request.args
+    filtros = {'desde': a.get('desde'), 'hasta': a.get('hasta'), 'tipo_actividad': a.get('tipo_actividad')}
+    orden = 'desc' if a.get('orden') == 'desc' else 'asc'
+    try: despues = texto_a_clave(a.get('despues'))
+    except ValueError: return "Cursor inválido", 400
+    pendientes, siguiente = db.listar_pendientes(despues, orden, ADMIN_POR_PAGINA, **filtros)
+    por_dia, por_tipo = db.conteos_pendientes(**filtros)
+    return render_template('admin.html', pendientes=pendientes, siguiente=clave_a_texto(siguiente), filtros=filtros, orden=orden,
+                           por_dia=por_dia, por_tipo=por_tipo, total=sum(t['n'] for t in por_tipo), tipos=TIPOS_ACTIVIDAD, estados=ESTADOS)
 
 @app.route('/procesar_reserva', methods=['POST'])
 def procesar():
     if not session.get('admin_logueado'): return redirect('/login')
-    estado = "Aprobada" if request.form['accion'] == "Aprobar" else "Rechazada"
-    conn = sqlite3.connect(DB_PATH); conn.execute("UPDATE reservas_laboratorio SET estado = ? WHERE id = ?", (estado, request.form['id'])); conn.commit(); conn.close()
+    # Acepta el formulario clásico (un id) o un lote: varios `id`, o `fecha` para
+    # aprobar todas las pendientes sin cruce de ese día. Por JSON (cuerpo JSON o
+    # Accept: application/json) responde con el resultado en vez de redirigir.
+    d = request.get_json(silent=True) if request.is_json else request.form
+    if d is not request.form and not isinstance(d, dict): return "Se espera un objeto JSON", 400
+    # Sin acción válida no se hace nada: un error de tipeo no debe rechazar un lote entero.
+    accion = d.get('accion')
+    if accion not in ("Aprobar", "Rechazar"): return "Acción inválida", 400
+    ids = d.get('ids') or (request.form.getlist('id') if d is request.form else [])
+    # Un texto también es iterable: "12" rechazaría las reservas 1 y 2.
+    if not isinstance(ids, list): return "ids debe ser una lista", 400
+    try:
+        if accion == "Aprobar": res = db.procesar_lote(aprobar=ids, fecha=d.get('fecha'))
+        else: res = db.procesar_lote(rechazar=ids)
+    except (TypeError, ValueError): return "Id inválido", 400
+    if request.is_json or request.accept_mimetypes.best == 'application/json': return jsonify(res)
     return redirect('/admin')
 
 @app.route('/descargar_reporte')
 def descargar_reporte():
     if not session.get('admin_logueado'): return redirect('/login')
-    conn = sqlite3.connect(DB_PATH); cur = conn.cursor(); cur.execute("SELECT * FROM reservas_laboratorio"); data = cur.fetchall(); cols = [d[0] for d in cur.description]; conn.close()
-    si = io.StringIO(); cw = csv.writer(si); cw.writerow(cols); cw.writerows(data)
-    resp = make_response(si.getvalue()); resp.headers["Content-Disposition"] = "attachment; filename=reporte.csv"; resp.headers["Content-type"] = "text/csv"
-    return resp
+    a = request.args
+    filtros = {'desde': a.get('desde'), 'hasta': a.get('hasta'), 'estado': a.get('estado'), 'tipo_actividad': a.get('tipo_actividad')}
+    cols, lotes = db.reporte(**filtros)
+    if a.get('formato') == 'xlsx':
+        cuerpo, tipo, nombre = exportar.xlsx_en_flujo(cols, lotes), 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'reporte.xlsx'
+    else:
+        cuerpo, tipo, nombre = exportar.csv_en_flujo(cols, lotes), 'text/csv', 'reporte.csv'
+    return Response(cuerpo, mimetype=tipo, headers={'Content-Disposition': f'attachment; filename={nombre}'})
+
+# Todas las cartas que cumplen los filtros en un solo ZIP (sin estado, o con
+# "Todos" en el formulario, las aprobadas). Se genera en paralelo y se envía a medida que las cartas salen.
+@app.route('/descargar_cartas')
+def descargar_cartas():
+    if not session.get('admin_logueado'): return redirect('/login')
+    a = request.args
+    _, lotes = db.reporte(desde=a.get('desde'), hasta=a.get('hasta'), estado=a.get('estado') or 'Aprobada', tipo_actividad=a.get('tipo_actividad'))
+    filas = (fila for lote in lotes for fila in lote)
+    return Response(cartas.zip_cartas(filas), mimetype='application/zip', headers={'Content-Disposition': 'attachment; filename=cartas.zip'})
+
+@app.route('/metrics')
+def metrics():
+    if not metricas.ACTIVAS: return "Métricas desactivadas", 404
+    token_valido = METRICAS_TOKEN and request.headers.get('Authorization') == f'Bearer {METRICAS_TOKEN}'
+    if not (session.get('admin_logueado') or token_valido): return "No autorizado", 403
+    return Response(metricas.exponer(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/logout')
 def logout(): session.pop('admin_logueado', None); return redirect('/reservalab')
@@ -0,0 +1,155 @@
+# Prueba de carga local para la app de reservas (sin servicios externos).
+#
+# Lanza hilos que mezclan listado, reservas, descarga de cartas y exportación
+# contra un servidor y muestra, por endpoint, peticiones/seg y latencias
+# p50/p95/p99. Con --iniciar levanta su propio gunicorn (gunicorn.conf.py) con
+# una base temporal y lo apaga al terminar:
+#
+#   python bench.py --iniciar --hilos 32 --segundos 20
+#   python bench.py --url http://127.0.0.1:10000 --mezcla reservalab=4,reservar=1
+#
+# Con --render N mide, dentro del proceso y sin red, el tiempo medio de
+# respuesta (consulta + render) de /reservalab, /login y /admin:
+#
+#   DB_PATH=/tmp/bench.db python bench.py --render 2000
+import argparse
+import http.cookiejar
+import itertools
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from datetime import date, timedelta
+
+MEZCLA = 'reservalab=5,api=2,reservar=2,carta=2,reporte=1'
+CLAVE_ADMIN = 'admin123'
+
+_slots = itertools.count()
+_ids = []  # reservas creadas durante la prueba, para pedir sus cartas
+
+def _datos_reserva():
+    # Cada reserva cae en un horario distinto para que ninguna choque.
+    k = next(_slots)
+    dia = date.today() + timedelta(days=400 + k // 48)
+    minutos = 6 * 60 + (k % 48) * 20
+    ini, fin = f"{minutos // 60:02d}:{minutos % 60:02d}", f"{(minutos + 15) // 60:02d}:{(minutos + 15) % 60:02d}"
+    return urllib.parse.urlencode({
+        'nombre': 'Bench', 'registro': '1', 'ci': '1', 'celular': '1', 'email': 'b@b.bo',
+        'tipo_actividad': 'Taller', 'objetivo': 'Benchmark', 'participantes': '5',
+        'fecha': dia.isoformat(), 'inicio': ini, 'fin': fin,
+    }).encode()
+
+# --- ENDPOINTS ---
+# Cada uno recibe la función para abrir URLs del hilo (con su cookie de sesión)
+# y la URL base.
+def _reservalab(abrir, url): abrir(url + '/reservalab').read()
+def _api(abrir, url): abrir(url + '/api/calendario?ventana=mes').read()
+def _reporte(abrir, url): abrir(url + '/descargar_reporte?formato=xlsx').read()
+
+def _reservar(abrir, url):
+    html = abrir(url + '/reservar', data=_datos_reserva()).read()
+    m = re.search(rb'/descargar_carta/(\d+)', html)
+    if m: _ids.append(int(m.group(1)))
+
+def _carta(abrir, url):
+    if not _ids: return _reservar(abrir, url)  # todavía no hay cartas que pedir
+    abrir(url + f'/descargar_carta/{random.choice(_ids)}').read()
+
+ENDPOINTS = {'reservalab': _reservalab, 'api': _api, 'reservar': _reservar, 'carta': _carta, 'reporte': _reporte}
+
+def _percentil(valores, p):
+    if not valores: return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+def _trabajador(url, fin, mezcla, tiempos, errores, lock):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    abrir = lambda u, data=None: opener.open(u, data=data, timeout=60)
+    if 'reporte' in mezcla: abrir(url + '/login', data=urllib.parse.urlencode({'password': CLAVE_ADMIN}).encode()).read()
+    nombres, pesos = list(mezcla), list(mezcla.values())
+    while time.perf_counter() < fin:
+        nombre = random.choices(nombres, pesos)[0]
+        t0 = time.perf_counter()
+        try:
+            ENDPOINTS[nombre](abrir, url)
+        except Exception:
+            with lock: errores[nombre] = errores.get(nombre, 0) + 1
+            continue
+        with lock: tiempos.setdefault(nombre, []).append(time.perf_counter() - t0)
+
+def _carga(url, hilos, segundos, mezcla):
+    tiempos, errores, lock = {}, {}, threading.Lock()
+    fin = time.perf_counter() + segundos
+    trabajadores = [threading.Thread(target=_trabajador, args=(url, fin, mezcla, tiempos, errores, lock)) for _ in range(hilos)]
+    for h in trabajadores: h.start()
+    for h in trabajadores: h.join()
+
+    print(f"{'endpoint':<12}{'peticiones':>11}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errores':>9}")
+    for nombre in sorted(set(tiempos) | set(errores)):
+        t = tiempos.get(nombre, [])
+        print(f"{nombre:<12}{len(t):>11}{len(t) / segundos:>9.1f}{_percentil(t, 50) * 1000:>9.1f}"
+              f"{_percentil(t, 95) * 1000:>9.1f}{_percentil(t, 99) * 1000:>9.1f}{errores.get(nombre, 0):>9}")
+    total = sum(len(t) for t in tiempos.values())
+    print(f"{'total':<12}{total:>11}{total / segundos:>9.1f}")
+
+# Levanta gunicorn con la configuración del repo sobre una base temporal.
+# Devuelve también la carpeta temporal, que main() borra al terminar.
+def _iniciar_servidor():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0)); puerto = s.getsockname()[1]
+    tmp = tempfile.mkdtemp(prefix='bench_')
+    entorno = dict(os.environ, PORT=str(puerto), DB_PATH=os.path.join(tmp, 'bench.db'), CARTAS_CACHE_DIR=os.path.join(tmp, 'cartas'))
+    carpeta = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'], cwd=carpeta, env=entorno)
+    url = f'http://127.0.0.1:{puerto}'
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(url + '/reservalab', timeout=1).read()
+            return proc, url, tmp
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate(); proc.wait()
+    shutil.rmtree(tmp, ignore_errors=True)
+    sys.exit('gunicorn no respondió')
+
+def _render(n):
+    from app import app
+    cliente = app.test_client()
+    with cliente.session_transaction() as s: s['admin_logueado'] = True
+    print(f"{'ruta':<14}{'us/petición':>14}")
+    for ruta in ('/reservalab', '/login', '/admin'):
+        cliente.get(ruta)
+        t0 = time.perf_counter()
+        for _ in range(n): cliente.get(ruta)
+        print(f"{ruta:<14}{(time.perf_counter() - t0) / n * 1e6:>14.0f}")
+
+def main():
+    ap = argparse.ArgumentParser(description='Prueba de carga local de la app de reservas')
+    ap.add_argument('--url', default='http://127.0.0.1:10000')
+    ap.add_argument('--iniciar', action='store_true', help='levantar un gunicorn propio con una base temporal')
+    ap.add_argument('--hilos', type=int, default=16)
+    ap.add_argument('--segundos', type=float, default=10)
+    ap.add_argument('--mezcla', default=MEZCLA, help=f'pesos por endpoint ({", ".join(ENDPOINTS)}); por defecto {MEZCLA}')
+    ap.add_argument('--render', type=int, metavar='N', help='micro-benchmark de render en proceso con N peticiones por ruta')
+    args = ap.parse_args()
+    if args.render: return _render(args.render)
+
+    mezcla = {k: float(v) for k, v in (p.split('=') for p in args.mezcla.split(','))}
+    if set(mezcla) - set(ENDPOINTS): ap.error(f'endpoints desconocidos: {", ".join(set(mezcla) - set(ENDPOINTS))}')
+    proc, url, tmp = _iniciar_servidor() if args.iniciar else (None, args.url.rstrip('/'), None)
+    try:
+        _carga(url, args.hilos, args.segundos, mezcla)
+    finally:
+        if proc: proc.terminate(); proc.wait()
+        if tmp: shutil.rmtree(tmp, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
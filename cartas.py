@@ -0,0 +1,224 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime
+from fpdf import FPDF
+import metricas
+from exportar import FlujoZip
+
+MESES = ["Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
+
+def fecha_en_letras(dia):
+    return f"{dia.day:02d} de {MESES[dia.month - 1]} de {dia.year}"
+
+# Campos de la reserva que aparecen en la carta.
+CAMPOS_CARTA = ('nombre', 'registro', 'ci', 'tipo_actividad', 'objetivo', 'fecha', 'hora_inicio', 'hora_fin', 'participantes')
+
+# Todo como texto, para que la clave de la caché no dependa de los tipos de
+# las columnas.
+def datos_carta(fila):
+    datos = {campo: str(fila[campo]) for campo in CAMPOS_CARTA}
+    datos['fecha_emision'] = fecha_en_letras(datetime.now().date())
+    return datos
+
+# --- PDF ---
+class PDF(FPDF): pass
+def crear_carta_pdf(datos):
+    pdf = PDF()
+    pdf.add_page(); pdf.set_margins(25, 25, 25)
+    def txt(t): return t.encode('latin-1', 'replace').decode('latin-1')
+    
+    fecha_actual = datos.get('fecha_emision') or fecha_en_letras(datetime.now().date())
+
+    pdf.set_font('Arial', '', 11)
+    pdf.cell(0, 10, txt(f"Santa Cruz de la Sierra, {fecha_actual}"), 0, 1, 'R'); pdf.ln(5)
+    
+    pdf.set_font('Arial', 'B', 11)
+    pdf.cell(0, 5, txt("Señor:"), 0, 1)
+    pdf.cell(0, 5, txt("M.Sc. Odin Rodriguez Mercado"), 0, 1)
+    pdf.set_font('Arial', '', 11)
+    pdf.cell(0, 5, txt("DIRECTOR DE CARRERA"), 0, 1)
+    pdf.cell(0, 5, txt("CIENCIA POLÍTICA Y ADM. PÚBLICA - UAGRM"), 0, 1)
+    pdf.set_font('Arial', 'B', 11)
+    pdf.cell(0, 5, txt("Presente.-"), 0, 1); pdf.ln(10)
+    
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(0, 10, txt("Ref.: SOLICITUD DE USO DE LABORATORIO"), 0, 1, 'R'); pdf.ln(5)
+    pdf.set_font('Arial', '', 12)
+    cuerpo = f"""De mi mayor consideración:
+
+Mediante la presente, yo, {datos['nombre']}, con Registro Universitario N° {datos['registro']} y C.I. {datos['ci']}, solicito a su autoridad la autorización para el uso del Laboratorio de Análisis Político.
+
+La actividad a realizar es "{datos['tipo_actividad']}" con el siguiente propósito: {datos['objetivo']}.
+
+Detalles:
+- Fecha: {datos['fecha']}
+- Horario: De {datos['hora_inicio']} a {datos['hora_fin']}
+- Participantes: {datos['participantes']}
+
+Me comprometo a hacer un uso responsable de los equipos e instalaciones.
+
+Sin otro particular, me despido atentamente."""
+    pdf.multi_cell(0, 7, txt(cuerpo)); pdf.ln(30)
+    
+    pdf.set_font('Arial', '', 11)
+    pdf.cell(0, 5, "____________________________________", 0, 1, 'C')
+    pdf.cell(0, 5, txt(datos['nombre']), 0, 1, 'C')
+    pdf.cell(0, 5, txt(f"C.I.: {datos['ci']}"), 0, 1, 'C')
+    return pdf.output(dest='S').encode('latin-1')
+
+# --- GENERACIÓN FUERA DEL PROCESO WEB ---
+# crear_carta_pdf es CPU pura: con CARTAS_PROCESOS > 0 se ejecuta en un pool de
+# procesos (uno por worker de gunicorn, creado al primer uso) y el GIL del worker
+# queda libre para atender otras peticiones mientras tanto. Con 0 se genera en
+# el mismo hilo, como antes.
+CARTAS_PROCESOS = int(os.environ.get('CARTAS_PROCESOS', '1'))
+CARTAS_LOTE_PROCESOS = int(os.environ.get('CARTAS_LOTE_PROCESOS', str(os.cpu_count() or 2)))
+_pool, _pool_pid = None, None
+_pool_lock = threading.Lock()
+
+def _pool_procesos():
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # spawn: los hijos no heredan hilos ni conexiones del worker.
+            _pool = ProcessPoolExecutor(CARTAS_PROCESOS, mp_context=multiprocessing.get_context('spawn'))
+            _pool_pid = os.getpid()
+        return _pool
+
+# Arranca el pool por adelantado (gunicorn lo llama al iniciar cada worker)
+# para que la primera carta no pague el arranque de los procesos.
+def calentar():
+    if CARTAS_PROCESOS > 0: _pool_procesos().submit(fecha_en_letras, datetime.now().date()).result()
+
+def generar_carta(datos):
+    with metricas.cronometro(metricas.PDF):
+        if CARTAS_PROCESOS <= 0: return crear_carta_pdf(datos)
+        return _pool_procesos().submit(crear_carta_pdf, datos).result()
+
+# --- LOTE DE CARTAS ---
+# Varias cartas por tarea para no pagar el viaje entre procesos por cada una.
+CARTAS_POR_TAREA = 8
+
+def _crear_cartas_pdf(lote):
+    return [(id_reserva, crear_carta_pdf(datos)) for id_reserva, datos in lote]
+
+# ZIP con una carta por reserva, entregado a medida que se arma. Las cartas
+# que ya están en la caché se copian tal cual; el resto se reparte en tareas
+# entre los procesos de un pool propio de la exportación, que se cierra al
+# terminar (o si el cliente corta), y cada tarea se escribe al terminar, sin
+# esperar el orden. Como mucho hay dos tareas por proceso en vuelo, así la
+# memoria no crece con el tamaño del lote.
+def zip_cartas(filas):
+    flujo = FlujoZip()
+    pool = ProcessPoolExecutor(CARTAS_LOTE_PROCESOS, mp_context=multiprocessing.get_context('spawn'))
+    en_vuelo, lote = set(), []
+    try:
+        # Los PDF ya vienen comprimidos: se guardan sin volver a comprimir.
+        with zipfile.ZipFile(flujo, 'w', zipfile.ZIP_STORED) as z:
+            def escribir(terminadas):
+                for tarea in terminadas:
+                    for id_reserva, contenido in tarea.result(): z.writestr(f'Carta_{id_reserva}.pdf', contenido)
+            for fila in filas:
+                datos = datos_carta(fila)
+                contenido = cache.leer(clave_carta(datos))
+                if contenido is not None:
+                    z.writestr(f"Carta_{fila['id']}.pdf", contenido)
+                else:
+                    lote.append((fila['id'], datos))
+                    if len(lote) == CARTAS_POR_TAREA:
+                        en_vuelo.add(pool.submit(_crear_cartas_pdf, lote)); lote = []
+                if len(en_vuelo) >= 2 * CARTAS_LOTE_PROCESOS:
+                    terminadas, en_vuelo = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                    escribir(terminadas)
+                yield flujo.vaciar()
+            if lote: en_vuelo.add(pool.submit(_crear_cartas_pdf, lote))
+            while en_vuelo:
+                terminadas, en_vuelo = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                escribir(terminadas)
+                yield flujo.vaciar()
+        yield flujo.vaciar()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+# --- CACHÉ DE CARTAS ---
+# Cada PDF se guarda en disco con el hash de su contenido (los datos de la
+# carta, incluida la fecha de emisión) como nombre: si la reserva cambia, cambia
+# la clave y nunca se sirve una carta vieja; las que ya no se piden salen por
+# antigüedad. El mtime hace de marca LRU y, al pasar de `max_bytes`, se borran
+# primero los archivos menos usados.
+#
+# El tamaño total se lleva en memoria y el directorio solo se recorre cuando
+# pasa del límite. Cada worker suma lo que escribe él, así que entre recorridos
+# el total es aproximado; cada recorrido lo vuelve a poner al día.
+def clave_carta(datos):
+    return hashlib.sha256(json.dumps(datos, sort_keys=True, default=str).encode()).hexdigest()[:32]
+
+class CachePDF:
+    def __init__(self, directorio, max_bytes):
+        self.directorio, self.max_bytes = directorio, max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+        self._total = sum(tam for _, tam, _ in self._archivos())
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, clave + '.pdf')
+
+    def _archivos(self):
+        archivos = []
+        for entrada in os.scandir(self.directorio):
+            if entrada.name.endswith('.pdf'):
+                try: st = entrada.stat()
+                except OSError: continue
+                archivos.append((st.st_mtime, st.st_size, entrada.path))
+        return archivos
+
+    def leer(self, clave):
+        try:
+            with open(self._ruta(clave), 'rb') as f: contenido = f.read()
+            os.utime(self._ruta(clave))
+            return contenido
+        except OSError:
+            return None
+
+    def guardar(self, clave, contenido):
+        # Escritura atómica: otro worker nunca ve un PDF a medio escribir.
+        tmp = f"{self._ruta(clave)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f: f.write(contenido)
+        nuevo = not os.path.exists(self._ruta(clave))
+        os.replace(tmp, self._ruta(clave))
+        with self._lock:
+            if nuevo: self._total += len(contenido)
+            if self._total > self.max_bytes: self._recortar()
+
+    # Se llama con el lock tomado.
+    def _recortar(self):
+        archivos = self._archivos()
+        total = sum(a[1] for a in archivos)
+        for _, tam, ruta in sorted(archivos):
+            if total <= self.max_bytes: break
+            try: os.remove(ruta)
+            except OSError: pass
+            total -= tam
+        self._total = total
+
+    def carta(self, datos, clave=None):
+        clave = clave or clave_carta(datos)
+        contenido = self.leer(clave)
+        if contenido is None:
+            contenido = generar_carta(datos)
+            self.guardar(clave, contenido)
+        return contenido
+
+cache = CachePDF(os.environ.get('CARTAS_CACHE_DIR', 'cache_cartas'), int(os.environ.get('CARTAS_CACHE_MB', '50')) * 1024 * 1024)
+
+# Generación anticipada: tras insertar una reserva la carta se prepara en
+# segundo plano, así la primera descarga ya sale de la caché.
+_pregeneracion = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cartas')
+
+def pregenerar(datos):
+    _pregeneracion.submit(cache.carta, datos)
@@ -0,0 +1,252 @@
+import os
+import threading
+from contextlib import contextmanager
+from ocupacion import IndiceIntervalos
+import motores
+
+# --- CONFIGURACIÓN BASE DE DATOS ---
+# Sin DATABASE_URL se usa un archivo SQLite local. OJO: en la versión gratuita
+# de Render el disco no persiste entre reinicios; para producción se define
+# DATABASE_URL=postgresql://... (ver motores.py y migrar.py para pasar los datos).
+DB_PATH = os.environ.get('DB_PATH', 'laboratorio_politico.db')
+motor = motores.crear_motor(os.environ.get('DATABASE_URL') or DB_PATH)
+
+# Cambia el motor del proceso (lo usan migrar.py y las pruebas); la conexión
+# de este hilo se cierra para que la próxima se abra contra la base nueva, y el
+# índice se vacía porque sus versiones eran las de la base anterior.
+def usar(url):
+    global motor, indice
+    cerrar_conexion()
+    motor = motores.crear_motor(url)
+    indice = IndiceIntervalos()
+
+# --- POOL DE CONEXIONES ---
+# Una conexión de larga vida por hilo y por proceso (cada worker de gunicorn
+# tiene la suya), con cualquiera de los dos motores. sqlite3 guarda en caché
+# las sentencias ya preparadas de cada conexión, así que reutilizar la misma
+# cadena SQL evita volver a compilarla; en PostgreSQL se ahorra el handshake
+# de cada petición y el total queda acotado a workers × hilos.
+_local = threading.local()
+
+def obtener_conexion():
+    conn = getattr(_local, 'conn', None)
+    # Tras un fork (gunicorn --preload) la conexión heredada no es válida.
+    if conn is None or _local.pid != os.getpid() or not motor.valida(conn):
+        conn = motor.conectar()
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+def cerrar_conexion():
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+    _local.conn = None
+
+# inmediata=True toma el bloqueo de escritura al empezar (ver BEGIN_ESCRITURA
+# de cada motor), así lo que se lee dentro de la transacción no puede cambiar
+# antes del COMMIT.
+# Un COMMIT que falla (SQLITE_BUSY, conexión cortada) también se deshace: la
+# conexión del hilo es de larga vida y no puede quedar con una transacción
+# abierta. Si ni el ROLLBACK funciona, se descarta y el próximo uso abre otra.
+@contextmanager
+def transaccion(inmediata=False):
+    conn = obtener_conexion()
+    try:
+        for sql in motor.BEGIN_ESCRITURA if inmediata else motor.BEGIN:
+            conn.execute(sql)
+        yield conn
+        conn.execute('COMMIT')
+    except BaseException:
+        try:
+            if motor.valida(conn): conn.execute('ROLLBACK')
+        except Exception:
+            cerrar_conexion()
+        raise
+
+def consultar(sql, params=()):
+    return obtener_conexion().execute(sql, params).fetchall()
+
+def consultar_uno(sql, params=()):
+    return obtener_conexion().execute(sql, params).fetchone()
+
+# --- ESQUEMA ---
+# Cada entrada es una migración (una lista de sentencias, o una función que la
+# arma según el motor); cada motor guarda cuántas se aplicaron.
+MIGRACIONES = [
+    # 1: índice de cobertura para la detección de cruces
+    [
+        'CREATE INDEX IF NOT EXISTS idx_reservas_cruce ON reservas_laboratorio (fecha, estado, hora_inicio, hora_fin)',
+    ],
+    # 2: contador de versión de datos, incrementado por triggers en cada escritura
+    #    (tabla y triggers dependen del motor)
+    lambda motor: motor.VERSION_DATOS,
+    # 3: orden del calendario (el rowid/id va implícito al final del índice)
+    [
+        'CREATE INDEX IF NOT EXISTS idx_reservas_calendario ON reservas_laboratorio (fecha, hora_inicio, estado)',
+    ],
+    # 4: cola del director (pendientes por fecha y por tipo de actividad)
+    [
+        'CREATE INDEX IF NOT EXISTS idx_reservas_estado ON reservas_laboratorio (estado, fecha, hora_inicio)',
+        'CREATE INDEX IF NOT EXISTS idx_reservas_estado_tipo ON reservas_laboratorio (estado, tipo_actividad, fecha, hora_inicio)',
+    ],
+]
+
+def inicializar_db():
+    try:
+        # IMMEDIATE: si varios workers arrancan a la vez, solo uno migra.
+        with transaccion(inmediata=True) as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS reservas_laboratorio (
+                    id {},
+                    nombre TEXT NOT NULL,
+                    registro TEXT NOT NULL,
+                    ci TEXT NOT NULL,
+                    celular TEXT NOT NULL,
+                    email TEXT NOT NULL,
+                    responsable_actividad TEXT,
+                    tipo_actividad TEXT NOT NULL,
+                    objetivo TEXT NOT NULL,
+                    fecha TEXT NOT NULL,
+                    hora_inicio TEXT NOT NULL,
+                    hora_fin TEXT NOT NULL,
+                    participantes INTEGER NOT NULL,
+                    estado TEXT DEFAULT 'Pendiente'
+                )
+            '''.format(motor.CLAVE_ID))
+            aplicadas = motor.version_esquema(conn)
+            for n, sentencias in enumerate(MIGRACIONES[aplicadas:], start=aplicadas + 1):
+                for sql in sentencias(motor) if callable(sentencias) else sentencias:
+                    conn.execute(sql)
+                motor.fijar_version_esquema(conn, n)
+    except Exception as e:
+        print(f"Error DB: {e}")
+
+# --- CONSULTAS ---
+# Paginación por clave: se continúa después de la última fila (fecha, hora_inicio, id)
+# vista, sin OFFSET, así cada página cuesta lo mismo sin importar el historial.
+SQL_CALENDARIO = "SELECT id, nombre, tipo_actividad, fecha, hora_inicio, hora_fin, estado FROM reservas_laboratorio WHERE estado != 'Rechazada' AND fecha BETWEEN ? AND ? AND (fecha, hora_inicio, id) > (?, ?, ?) ORDER BY fecha, hora_inicio, id LIMIT ?"
+SQL_INSERTAR = '''INSERT INTO reservas_laboratorio (nombre, registro, ci, celular, email, responsable_actividad, tipo_actividad, objetivo, fecha, hora_inicio, hora_fin, participantes) VALUES (?,?,?,?,?,?,?,?,?,?,?,?)'''
+SQL_RESERVA = "SELECT * FROM reservas_laboratorio WHERE id = ?"
+SQL_PENDIENTES = "SELECT id, nombre, tipo_actividad, objetivo, fecha, hora_inicio, hora_fin, participantes FROM reservas_laboratorio"
+SQL_CONTEO_DIA = "SELECT fecha, COUNT(*) AS n FROM reservas_laboratorio{} GROUP BY fecha ORDER BY fecha"
+SQL_CONTEO_TIPO = "SELECT tipo_actividad, COUNT(*) AS n FROM reservas_laboratorio{} GROUP BY tipo_actividad ORDER BY n DESC"
+SQL_ACTUALIZAR_ESTADO = "UPDATE reservas_laboratorio SET estado = ? WHERE id = ?"
+SQL_REPORTE = "SELECT * FROM reservas_laboratorio"
+SQL_VERSION = "SELECT version FROM version_datos WHERE id = 1"
+SQL_INTERVALOS_DIA = "SELECT id, hora_inicio, hora_fin FROM reservas_laboratorio WHERE fecha = ? AND estado != 'Rechazada'"
+SQL_INTERVALOS_RANGO = "SELECT fecha, id, hora_inicio, hora_fin FROM reservas_laboratorio WHERE fecha BETWEEN ? AND ? AND estado != 'Rechazada'"
+SQL_HORARIO = "SELECT id, fecha, hora_inicio, hora_fin, estado FROM reservas_laboratorio WHERE id = ?"
+SQL_PENDIENTES_DIA = "SELECT id FROM reservas_laboratorio WHERE fecha = ? AND estado = 'Pendiente' ORDER BY hora_inicio, id"
+SQL_CRUCE_ESTADO = "SELECT id FROM reservas_laboratorio WHERE fecha = ? AND hora_inicio < ? AND hora_fin > ? AND estado = ? AND id != ?"
+
+indice = IndiceIntervalos()
+
+def version_datos(conn=None):
+    return (conn or obtener_conexion()).execute(SQL_VERSION).fetchone()[0]
+
+def _cruce(conn, fecha, inicio, fin):
+    cargar = lambda f: conn.execute(SQL_INTERVALOS_DIA, (f,)).fetchall()
+    return indice.cruce(version_datos(conn), fecha, inicio, fin, cargar)
+
+def hay_cruce(fecha, inicio, fin):
+    # Transacción de lectura: versión e intervalos salen de la misma foto.
+    with transaccion() as conn:
+        return _cruce(conn, fecha, inicio, fin)
+
+# (mapa de ocupación, horarios ocupados) de cada día entre `desde` y `hasta`
+# (ver ocupacion.py).
+def ocupacion(desde, hasta):
+    with transaccion() as conn:
+        cargar = lambda d, h: conn.execute(SQL_INTERVALOS_RANGO, (d, h)).fetchall()
+        return indice.mapas(version_datos(conn), desde, hasta, cargar)
+
+# Comprobación e inserción en una sola transacción BEGIN IMMEDIATE: dos
+# solicitudes simultáneas no pueden pasar ambas el control de cruce.
+# Devuelve el id nuevo, o None si el horario ya está ocupado.
+def reservar_si_libre(valores):
+    fecha, ini, fin = valores[8:11]
+    with transaccion(inmediata=True) as conn:
+        if _cruce(conn, fecha, ini, fin): return None
+        antes = version_datos(conn)
+        nid = motor.insertar(conn, SQL_INSERTAR, valores)
+        despues = version_datos(conn)
+    indice.aplicar(antes, despues, agregar=[(fecha, nid, ini, fin)])
+    return nid
+
+# Devuelve (filas, siguiente); `siguiente` es la clave de la última fila si hay
+# más resultados en la ventana, o None.
+def listar_calendario(desde, hasta, despues=None, limite=20):
+    fecha, hora, id_ = despues or ('', '', 0)
+    filas = consultar(SQL_CALENDARIO, (desde or '0000-00-00', hasta or '9999-12-31', fecha, hora, id_, limite + 1))
+    if len(filas) <= limite: return filas, None
+    ultima = filas[limite - 1]
+    return filas[:limite], (ultima['fecha'], ultima['hora_inicio'], ultima['id'])
+
+# Filtros comunes de los listados del director. Solo se agregan al WHERE los
+# que vienen con valor, para que la base pueda usar los índices por fecha.
+def _filtros(desde=None, hasta=None, estado=None, tipo_actividad=None):
+    condiciones, params = [], []
+    if desde: condiciones.append('fecha >= ?'); params.append(desde)
+    if hasta: condiciones.append('fecha <= ?'); params.append(hasta)
+    if estado: condiciones.append('estado = ?'); params.append(estado)
+    if tipo_actividad: condiciones.append('tipo_actividad = ?'); params.append(tipo_actividad)
+    return (' WHERE ' + ' AND '.join(condiciones) if condiciones else ''), params
+
+def obtener_reserva(id_reserva):
+    return consultar_uno(SQL_RESERVA, (id_reserva,))
+
+# Cola del director, paginada por clave igual que el calendario; `orden` es
+# 'asc' o 'desc' sobre (fecha, hora_inicio, id).
+def listar_pendientes(despues=None, orden='asc', limite=25, **filtros):
+    where, params = _filtros(estado='Pendiente', **filtros)
+    desc = orden == 'desc'
+    if despues:
+        where += f" AND (fecha, hora_inicio, id) {'<' if desc else '>'} (?, ?, ?)"; params += list(despues)
+    direccion = 'DESC' if desc else 'ASC'
+    sql = f"{SQL_PENDIENTES}{where} ORDER BY fecha {direccion}, hora_inicio {direccion}, id {direccion} LIMIT ?"
+    filas = consultar(sql, params + [limite + 1])
+    if len(filas) <= limite: return filas, None
+    ultima = filas[limite - 1]
+    return filas[:limite], (ultima['fecha'], ultima['hora_inicio'], ultima['id'])
+
+# Totales de pendientes por día y por tipo de actividad, con los mismos filtros.
+def conteos_pendientes(**filtros):
+    where, params = _filtros(estado='Pendiente', **filtros)
+    return consultar(SQL_CONTEO_DIA.format(where), params), consultar(SQL_CONTEO_TIPO.format(where), params)
+
+# Aprueba y rechaza en una sola transacción. Al aprobar una reserva, las
+# pendientes que se cruzan con su horario se rechazan solas; una aprobación que
+# chocaría con otra ya aprobada se omite. Con `fecha` se aprueban todas las
+# pendientes de ese día que no se crucen, en orden de hora de inicio.
+def procesar_lote(aprobar=(), rechazar=(), fecha=None):
+    resultado = {'aprobadas': [], 'rechazadas': [], 'auto_rechazadas': [], 'omitidas': []}
+    quitar, agregar = [], []
+    with transaccion(inmediata=True) as conn:
+        antes = version_datos(conn)
+        if fecha: aprobar = list(aprobar) + [f['id'] for f in conn.execute(SQL_PENDIENTES_DIA, (fecha,))]
+        filas = [f for f in (conn.execute(SQL_HORARIO, (int(i),)).fetchone() for i in dict.fromkeys(rechazar)) if f]
+        for f in filas:
+            conn.execute(SQL_ACTUALIZAR_ESTADO, ('Rechazada', f['id']))
+            resultado['rechazadas'].append(f['id']); quitar.append((f['fecha'], f['id']))
+        filas = [f for f in (conn.execute(SQL_HORARIO, (int(i),)).fetchone() for i in dict.fromkeys(aprobar)) if f]
+        for f in sorted(filas, key=lambda f: (f['fecha'], f['hora_inicio'], f['id'])):
+            clave = (f['fecha'], f['hora_fin'], f['hora_inicio'])
+            estado = conn.execute(SQL_HORARIO, (f['id'],)).fetchone()['estado']
+            if f['id'] in resultado['auto_rechazadas']: continue
+            if conn.execute(SQL_CRUCE_ESTADO, clave + ('Aprobada', f['id'])).fetchone():
+                resultado['omitidas'].append(f['id']); continue
+            conn.execute(SQL_ACTUALIZAR_ESTADO, ('Aprobada', f['id']))
+            resultado['aprobadas'].append(f['id'])
+            if estado == 'Rechazada': agregar.append((f['fecha'], f['id'], f['hora_inicio'], f['hora_fin']))
+            for c in conn.execute(SQL_CRUCE_ESTADO, clave + ('Pendiente', f['id'])).fetchall():
+                conn.execute(SQL_ACTUALIZAR_ESTADO, ('Rechazada', c['id']))
+                resultado['auto_rechazadas'].append(c['id']); quitar.append((f['fecha'], c['id']))
+        despues = version_datos(conn)
+    indice.aplicar(antes, despues, agregar=agregar, quitar=quitar)
+    return resultado
+
+# Devuelve (columnas, lotes): las filas se leen de a `tam` a medida que se
+# recorren los lotes (en PostgreSQL, con un cursor del lado del servidor).
+def reporte(tam=500, **filtros):
+    where, params = _filtros(**filtros)
+    return motor.lotes(obtener_conexion(), SQL_REPORTE + where + ' ORDER BY fecha, hora_inicio, id', params, tam)
@@ -0,0 +1,78 @@
+import csv
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+# --- EXPORTACIÓN EN FLUJO ---
+# Los generadores reciben las filas por lotes (ver db.reporte) y van entregando
+# bytes a medida que los producen: la respuesta empieza enseguida y en memoria
+# nunca hay más que un lote.
+
+def csv_en_flujo(columnas, lotes):
+    buf = io.StringIO(); cw = csv.writer(buf)
+    cw.writerow(columnas)
+    for lote in lotes:
+        cw.writerows(lote)
+        yield buf.getvalue().encode('utf-8')
+        buf.seek(0); buf.truncate()
+    yield buf.getvalue().encode('utf-8')
+
+# Archivo de solo escritura que acumula lo que zipfile escribe hasta vaciarlo.
+# No tiene seek(), así que zipfile escribe cada entrada con descriptor de datos
+# y no necesita volver atrás.
+class FlujoZip:
+    def __init__(self): self._partes = []
+    def write(self, datos): self._partes.append(bytes(datos)); return len(datos)
+    def flush(self): pass
+    def vaciar(self):
+        datos = b''.join(self._partes); self._partes.clear()
+        return datos
+
+# --- XLSX ---
+# Un .xlsx mínimo es un ZIP con cuatro partes fijas y la hoja. La hoja usa
+# cadenas en línea, así no hace falta la tabla de cadenas compartidas y se
+# puede escribir fila a fila.
+_XLSX_FIJOS = {
+    '[Content_Types].xml': '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>',
+    '_rels/.rels': '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>',
+    'xl/workbook.xml': '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Reservas" sheetId="1" r:id="rId1"/></sheets></workbook>',
+    'xl/_rels/workbook.xml.rels': '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>',
+}
+_HOJA_INICIO = b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+_HOJA_FIN = b'</sheetData></worksheet>'
+_INVALIDOS_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+def _celda(valor):
+    if valor is None: return '<c/>'
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool): return f'<c><v>{valor}</v></c>'
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(_INVALIDOS_XML.sub("", str(valor)))}</t></is></c>'
+
+def _fila_xml(fila):
+    return ('<row>' + ''.join(_celda(v) for v in fila) + '</row>').encode('utf-8')
+
+def xlsx_en_flujo(columnas, lotes):
+    flujo = FlujoZip()
+    with zipfile.ZipFile(flujo, 'w', zipfile.ZIP_DEFLATED) as z:
+        for nombre, contenido in _XLSX_FIJOS.items(): z.writestr(nombre, contenido)
+        with z.open('xl/worksheets/sheet1.xml', 'w') as hoja:
+            hoja.write(_HOJA_INICIO + _fila_xml(columnas))
+            for lote in lotes:
+                hoja.write(b''.join(_fila_xml(f) for f in lote))
+                yield flujo.vaciar()
+            hoja.write(_HOJA_FIN)
+    yield flujo.vaciar()
@@ -0,0 +1,24 @@
+# Configuración de gunicorn para alta concurrencia. gunicorn la lee sola si se
+# arranca desde esta carpeta (`gunicorn app:app`); cada valor se puede pisar
+# con variables de entorno.
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '10000')}"
+
+# Workers con hilos: mientras un hilo espera a SQLite o al pool de PDFs, los
+# demás siguen atendiendo. Un worker por núcleo más uno, y 4 hilos en cada uno.
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+keepalive = 5
+
+# Reciclar workers de vez en cuando evita que la memoria crezca sin límite.
+max_requests = 2000
+max_requests_jitter = 200
+
+def post_worker_init(worker):
+    import cartas
+    cartas.calentar()
@@ -0,0 +1,114 @@
+import os
+import sqlite3
+import threading
+from bisect import bisect_left
+from contextlib import nullcontext
+from time import perf_counter
+
+# --- MÉTRICAS (opcionales) ---
+# Con METRICAS=1 se mide cada petición, cada sentencia SQL y cada carta PDF, y
+# /metrics lo expone en formato de texto de Prometheus. Apagadas, las
+# conexiones son sqlite3.Connection normales y cronometro() devuelve un
+# contexto vacío: el costo es una comparación por llamada.
+ACTIVAS = os.environ.get('METRICAS', '').lower() in ('1', 'true', 'si')
+
+SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CANTIDADES = (1, 2, 5, 10, 20, 50, 100)
+
+class Histograma:
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=SEGUNDOS):
+        self.nombre, self.ayuda, self.etiquetas, self.limites = nombre, ayuda, etiquetas, limites
+        self._series = {}  # valores de etiquetas -> [conteos por límite..., +Inf, suma]
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *etiquetas):
+        i = bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._series.get(etiquetas)
+            if serie is None: serie = self._series[etiquetas] = [0] * (len(self.limites) + 2)
+            serie[i] += 1
+            serie[-1] += valor
+
+    def texto(self):
+        lineas = [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} histogram']
+        with self._lock: series = {k: list(v) for k, v in self._series.items()}
+        for valores, serie in sorted(series.items()):
+            base = ','.join(f'{e}="{_escapar(v)}"' for e, v in zip(self.etiquetas, valores))
+            sep, llaves = (',', f'{{{base}}}') if base else ('', '')
+            acumulado = 0
+            for limite, n in zip(self.limites + ('+Inf',), serie):
+                acumulado += n
+                lineas.append(f'{self.nombre}_bucket{{{base}{sep}le="{limite}"}} {acumulado}')
+            lineas.append(f'{self.nombre}_sum{llaves} {serie[-1]}')
+            lineas.append(f'{self.nombre}_count{llaves} {acumulado}')
+        return '\n'.join(lineas)
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+PETICIONES = Histograma('app_peticion_segundos', 'Duración de cada petición.', ('endpoint', 'metodo', 'estado'))
+SQL = Histograma('app_sql_segundos', 'Duración de cada sentencia SQL.', ('sentencia',))
+SQL_POR_PETICION = Histograma('app_sql_por_peticion', 'Sentencias SQL ejecutadas por petición.', ('endpoint',), CANTIDADES)
+PDF = Histograma('app_pdf_segundos', 'Tiempo de generación de una carta PDF.')
+TODOS = (PETICIONES, SQL, SQL_POR_PETICION, PDF)
+
+def cronometro(histograma, *etiquetas):
+    return _Cronometro(histograma, etiquetas) if ACTIVAS else nullcontext()
+
+class _Cronometro:
+    def __init__(self, histograma, etiquetas): self.histograma, self.etiquetas = histograma, etiquetas
+    def __enter__(self): self.t0 = perf_counter()
+    def __exit__(self, *exc): self.histograma.observar(perf_counter() - self.t0, *self.etiquetas)
+
+# --- SQL ---
+# Las sentencias se agrupan por verbo y tabla ("SELECT reservas_laboratorio")
+# para que las consultas con filtros variables no multipliquen las series.
+_local = threading.local()
+
+def _tipo_sentencia(sql):
+    palabras = [p for p in sql.split() if p.upper() not in ('IF', 'NOT', 'EXISTS')]
+    if not palabras: return ''
+    verbo = palabras[0].upper()
+    for clave in ('FROM', 'INTO', 'UPDATE', 'TABLE', 'INDEX', 'TRIGGER'):
+        for i, p in enumerate(palabras[:-1]):
+            if p.upper() == clave: return f'{verbo} {palabras[i + 1].strip("(")}'
+    return verbo
+
+def registrar_sql(sql, segundos):
+    SQL.observar(segundos, _tipo_sentencia(sql))
+    _local.sentencias = getattr(_local, 'sentencias', 0) + 1
+
+class ConexionMedida(sqlite3.Connection):
+    def execute(self, sql, params=()):
+        t0 = perf_counter()
+        try: return super().execute(sql, params)
+        finally: registrar_sql(sql, perf_counter() - t0)
+
+    def executemany(self, sql, params):
+        t0 = perf_counter()
+        try: return super().executemany(sql, params)
+        finally: registrar_sql(sql, perf_counter() - t0)
+
+fabrica_conexion = ConexionMedida if ACTIVAS else sqlite3.Connection
+
+# --- FLASK ---
+def instalar(app):
+    if not ACTIVAS: return
+    from flask import g, request
+
+    @app.before_request
+    def _inicio():
+        g.t0_metricas = perf_counter()
+        _local.sentencias = 0
+
+    @app.after_request
+    def _fin(response):
+        t0 = g.pop('t0_metricas', None)
+        if t0 is not None:
+            endpoint = request.endpoint or 'desconocido'
+            PETICIONES.observar(perf_counter() - t0, endpoint, request.method, response.status_code)
+            SQL_POR_PETICION.observar(getattr(_local, 'sentencias', 0), endpoint)
+        return response
+
+def exponer():
+    return '\n'.join(h.texto() for h in TODOS) + '\n'
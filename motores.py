@@ -0,0 +1,193 @@
+import itertools
+import os
+import sqlite3
+from time import perf_counter
+from urllib.request import pathname2url
+import metricas
+
+# --- MOTORES DE BASE DE DATOS ---
+# db.py escribe el SQL una sola vez, con parámetros `?`, y usa las conexiones
+# como sqlite3: conn.execute(sql, params) devuelve un cursor y las filas se
+# leen por nombre o por posición. Cada motor pone lo que no es común: cómo
+# conectar, cómo abrir transacciones, cómo obtener el id insertado, cómo
+# recorrer un resultado grande y las sentencias propias del esquema.
+
+def _en_lotes(cur, tam, primero=None):
+    try:
+        if primero: yield primero
+        while True:
+            filas = cur.fetchmany(tam)
+            if not filas: return
+            yield filas
+    finally:
+        cur.close()
+
+# --- SQLITE ---
+# WAL permite que los lectores no se bloqueen mientras alguien escribe.
+# synchronous=NORMAL es seguro con WAL y evita un fsync por cada commit.
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA cache_size=-8000',
+    'PRAGMA temp_store=MEMORY',
+)
+
+class MotorSQLite:
+    nombre = 'sqlite'
+    CLAVE_ID = 'INTEGER PRIMARY KEY AUTOINCREMENT'
+    BEGIN = ('BEGIN',)
+    BEGIN_ESCRITURA = ('BEGIN IMMEDIATE',)
+    VERSION_DATOS = [
+        'CREATE TABLE IF NOT EXISTS version_datos (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL, actualizado TEXT NOT NULL)',
+        'INSERT OR IGNORE INTO version_datos (id, version, actualizado) VALUES (1, 0, CURRENT_TIMESTAMP)',
+    ] + [
+        f'''CREATE TRIGGER IF NOT EXISTS trg_version_{op.lower()} AFTER {op} ON reservas_laboratorio
+            BEGIN UPDATE version_datos SET version = version + 1, actualizado = CURRENT_TIMESTAMP WHERE id = 1; END'''
+        for op in ('INSERT', 'UPDATE', 'DELETE')
+    ]
+
+    def __init__(self, ruta): self.ruta = ruta
+
+    def conectar(self):
+        # isolation_level=None: modo autocommit; las escrituras abren su propia
+        # transacción explícita con db.transaccion().
+        conn = sqlite3.connect(self.ruta, timeout=5, isolation_level=None, cached_statements=256, factory=metricas.fabrica_conexion)
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    # Solo lectura y sin PRAGMAs: no cambia el archivo de origen de una
+    # migración (ni su modo de diario) y no crea uno vacío si la ruta está mal.
+    def conectar_lectura(self):
+        if not os.path.isfile(self.ruta): raise FileNotFoundError(f'No existe la base SQLite {self.ruta}')
+        conn = sqlite3.connect(f'file:{pathname2url(os.path.abspath(self.ruta))}?mode=ro', uri=True)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def valida(self, conn): return True
+
+    # PRAGMA user_version guarda cuántas migraciones se aplicaron.
+    def version_esquema(self, conn):
+        return conn.execute('PRAGMA user_version').fetchone()[0]
+
+    def fijar_version_esquema(self, conn, n):
+        conn.execute(f'PRAGMA user_version = {n}')
+
+    def insertar(self, conn, sql, valores):
+        return conn.execute(sql, valores).lastrowid
+
+    # Los ids se copian tal cual; las filas que ya existen se saltan.
+    def insertar_lote(self, conn, tabla, columnas, filas):
+        sql = f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES ({', '.join('?' * len(columnas))}) ON CONFLICT (id) DO NOTHING"
+        conn.executemany(sql, [tuple(f) for f in filas])
+
+    def ajustar_secuencia(self, conn, tabla): pass  # AUTOINCREMENT sigue solo al id más alto
+
+    # Devuelve (columnas, lotes). El cursor de sqlite3 ya lee del archivo a
+    # medida que se le piden filas.
+    def lotes(self, conn, sql, params, tam):
+        cur = conn.execute(sql, params)
+        return [d[0] for d in cur.description], _en_lotes(cur, tam)
+
+# --- POSTGRESQL ---
+# psycopg2 solo hace falta si DATABASE_URL apunta a PostgreSQL. La conexión se
+# envuelve para que hable como sqlite3: execute() en la conexión, parámetros
+# `?` y filas DictRow (por nombre y por posición).
+class _ConexionPG:
+    def __init__(self, conn): self._conn = conn
+    @property
+    def closed(self): return self._conn.closed
+
+    def execute(self, sql, params=()):
+        cur = self._conn.cursor()
+        t0 = perf_counter()
+        try: cur.execute(sql.replace('?', '%s'), tuple(params) or None)
+        finally:
+            if metricas.ACTIVAS: metricas.registrar_sql(sql, perf_counter() - t0)
+        return cur
+
+    def cursor(self, *args, **kwargs): return self._conn.cursor(*args, **kwargs)
+    def close(self): self._conn.close()
+
+class MotorPostgres:
+    nombre = 'postgresql'
+    CLAVE_ID = 'SERIAL PRIMARY KEY'
+    # Lecturas con una sola foto de los datos, como BEGIN en SQLite. Para
+    # escribir, un bloqueo asesor de transacción hace de BEGIN IMMEDIATE: los
+    # escritores (reservar, procesar lote, migrar) pasan de a uno y el control
+    # de cruce ve todo lo confirmado antes. No se usa una restricción EXCLUDE
+    # porque una reserva rechazada puede volver a aprobarse.
+    BEGIN = ('BEGIN ISOLATION LEVEL REPEATABLE READ',)
+    BEGIN_ESCRITURA = ('BEGIN', 'SELECT pg_advisory_xact_lock(7301)')
+    _AHORA = "to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS')"
+    VERSION_DATOS = [
+        'CREATE TABLE IF NOT EXISTS version_datos (id INTEGER PRIMARY KEY CHECK (id = 1), version BIGINT NOT NULL, actualizado TEXT NOT NULL)',
+        f'INSERT INTO version_datos (id, version, actualizado) VALUES (1, 0, {_AHORA}) ON CONFLICT (id) DO NOTHING',
+        f'''CREATE OR REPLACE FUNCTION fn_version_datos() RETURNS trigger AS $$
+            BEGIN UPDATE version_datos SET version = version + 1, actualizado = {_AHORA} WHERE id = 1; RETURN NULL; END
+            $$ LANGUAGE plpgsql''',
+        '''CREATE TRIGGER trg_version AFTER INSERT OR UPDATE OR DELETE ON reservas_laboratorio
+            FOR EACH STATEMENT EXECUTE PROCEDURE fn_version_datos()''',
+    ]
+
+    def __init__(self, url):
+        try:
+            import psycopg2, psycopg2.extras
+        except ImportError:
+            raise RuntimeError('DATABASE_URL apunta a PostgreSQL pero psycopg2 no está instalado (pip install psycopg2-binary)')
+        self.url, self._pg = url, psycopg2
+        self._cursores = itertools.count()  # nombres de cursor únicos en el proceso
+
+    def conectar(self):
+        # autocommit: igual que en SQLite, las transacciones se abren a mano.
+        conn = self._pg.connect(self.url, cursor_factory=self._pg.extras.DictCursor, connect_timeout=5,
+                                keepalives=1, keepalives_idle=30, application_name='reservalab', client_encoding='utf8')
+        conn.autocommit = True
+        return _ConexionPG(conn)
+
+    def conectar_lectura(self):
+        conn = self.conectar()
+        conn.execute('SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY')
+        return conn
+
+    # Una conexión cortada por el servidor se reemplaza en el próximo uso.
+    def valida(self, conn): return not conn.closed
+
+    def version_esquema(self, conn):
+        conn.execute('CREATE TABLE IF NOT EXISTS esquema (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)')
+        conn.execute('INSERT INTO esquema (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING')
+        return conn.execute('SELECT version FROM esquema WHERE id = 1').fetchone()[0]
+
+    def fijar_version_esquema(self, conn, n):
+        conn.execute('UPDATE esquema SET version = ? WHERE id = 1', (n,))
+
+    def insertar(self, conn, sql, valores):
+        return conn.execute(sql + ' RETURNING id', valores).fetchone()[0]
+
+    # execute_values arma un solo INSERT con todas las filas del lote.
+    def insertar_lote(self, conn, tabla, columnas, filas):
+        sql = f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES %s ON CONFLICT (id) DO NOTHING"
+        with conn.cursor() as cur:
+            self._pg.extras.execute_values(cur, sql, [tuple(f) for f in filas], page_size=len(filas))
+
+    # Con ids copiados a mano la secuencia del SERIAL queda atrás.
+    def ajustar_secuencia(self, conn, tabla):
+        conn.execute(f"SELECT setval(pg_get_serial_sequence('{tabla}', 'id'), COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM {tabla}")
+
+    # Cursor con nombre: las filas quedan en el servidor y llegan de a `tam`.
+    # WITH HOLD lo mantiene abierto fuera de una transacción; las columnas se
+    # conocen recién con la primera lectura, que se entrega como primer lote.
+    def lotes(self, conn, sql, params, tam):
+        cur = conn.cursor(name=f'lotes_{next(self._cursores)}', withhold=True)
+        cur.itersize = tam
+        cur.execute(sql.replace('?', '%s'), tuple(params) or None)
+        primero = cur.fetchmany(tam)
+        return [d[0] for d in cur.description], _en_lotes(cur, tam, primero)
+
+# DATABASE_URL postgres:// o postgresql:// usa PostgreSQL; cualquier otra cosa
+# (o sqlite:///ruta) es la ruta de un archivo SQLite.
+def crear_motor(url):
+    if url.startswith(('postgres://', 'postgresql://')): return MotorPostgres(url)
+    return MotorSQLite(url[len('sqlite:///'):] if url.startswith('sqlite:///') else url)
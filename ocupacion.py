@@ -0,0 +1,138 @@
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from datetime import date, timedelta
+
+# --- MAPA DE OCUPACIÓN ---
+# Cada día se resume en un entero de 96 bits: el bit i es la franja de 15
+# minutos que empieza en i*15. Una reserva marca todas las franjas que toca, así
+# que el mapa es conservador: una franja marcada puede estar libre en parte.
+MINUTOS_FRANJA = 15
+FRANJAS_DIA = 24 * 60 // MINUTOS_FRANJA
+
+def minutos(hora):
+    return int(hora[:2]) * 60 + int(hora[3:5])
+
+def hora(minutos_dia):
+    return f"{minutos_dia // 60:02d}:{minutos_dia % 60:02d}"
+
+def mascara(inicio, fin):
+    a = minutos(inicio) // MINUTOS_FRANJA
+    b = min(FRANJAS_DIA, -(-minutos(fin) // MINUTOS_FRANJA))
+    return ((1 << (b - a)) - 1) << a if b > a else 0
+
+# El mapa solo sirve para dibujar: los horarios ocupados y libres exactos salen
+# de los intervalos. `fusionar` junta los que se tocan o se solapan.
+def fusionar(intervalos):
+    ocupados = []
+    for ini, fin in sorted(intervalos):
+        if ocupados and ini <= ocupados[-1][1]: ocupados[-1][1] = max(ocupados[-1][1], fin)
+        else: ocupados.append([ini, fin])
+    return [tuple(o) for o in ocupados]
+
+# Ventanas libres [(inicio, fin), ...] entre horarios ocupados ya fusionados.
+def horarios_libres(ocupados):
+    libres, desde = [], '00:00'
+    for ini, fin in ocupados:
+        if ini > desde: libres.append((desde, ini))
+        desde = max(desde, fin)
+    if desde < '24:00': libres.append((desde, '24:00'))
+    return libres
+
+# --- ÍNDICE DE INTERVALOS POR DÍA ---
+# Guarda en memoria, por fecha, los horarios no rechazados ordenados por hora de
+# inicio. Un cruce con [inicio, fin) existe si alguno de los intervalos que
+# empiezan antes de `fin` termina después de `inicio`; con el máximo acumulado
+# de las horas de fin basta un bisect para responder. Junto a cada día se guarda
+# su mapa de ocupación, que se recalcula cuando ese día cambia.
+#
+# El índice está atado a la versión de datos de la base (ver db.version_datos):
+# si otro proceso escribió, la versión cambia y se descarta todo lo cargado.
+class IndiceIntervalos:
+    def __init__(self, max_dias=366):
+        self.max_dias = max_dias
+        self._dias = OrderedDict()  # fecha -> (entradas, inicios, fines_max, mapa)
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _sincronizar(self, version):
+        if version != self._version:
+            self._dias.clear()
+            self._version = version
+
+    def _guardar(self, fecha, entradas):
+        inicios, fines_max, tope, mapa = [], [], '', 0
+        for ini, fin, _ in entradas:
+            tope = max(tope, fin)
+            inicios.append(ini); fines_max.append(tope)
+            mapa |= mascara(ini, fin)
+        self._dias[fecha] = (entradas, inicios, fines_max, mapa)
+        self._dias.move_to_end(fecha)
+        while len(self._dias) > self.max_dias:
+            self._dias.popitem(last=False)
+
+    def _dia(self, version, fecha, cargar):
+        self._sincronizar(version)
+        dia = self._dias.get(fecha)
+        if dia is None:
+            self._guardar(fecha, sorted((ini, fin, id_) for id_, ini, fin in cargar(fecha)))
+            dia = self._dias[fecha]
+        else:
+            self._dias.move_to_end(fecha)
+        return dia
+
+    # `cargar(fecha)` devuelve filas (id, hora_inicio, hora_fin) de ese día.
+    def cruce(self, version, fecha, inicio, fin, cargar):
+        with self._lock:
+            _, inicios, fines_max, _ = self._dia(version, fecha, cargar)
+            i = bisect_left(inicios, fin)
+            return i > 0 and fines_max[i - 1] > inicio
+
+    # (mapa, horarios ocupados fusionados) de cada día entre `desde` y `hasta`
+    # (fechas ISO). Los días que no están en memoria se cargan juntos con una
+    # sola consulta: `cargar_rango(desde, hasta)` devuelve filas
+    # (fecha, id, hora_inicio, hora_fin). El resultado se arma a medida que se
+    # leen los días, porque guardar los que faltan puede desalojar otros del rango.
+    def mapas(self, version, desde, hasta, cargar_rango):
+        inicio = date.fromisoformat(desde)
+        dias = [(inicio + timedelta(days=n)).isoformat() for n in range((date.fromisoformat(hasta) - inicio).days + 1)]
+        resultado = {}
+        with self._lock:
+            self._sincronizar(version)
+            faltan = {d: [] for d in dias if d not in self._dias}
+            for d in dias:
+                if d not in faltan:
+                    self._dias.move_to_end(d)
+                    resultado[d] = self._dias[d]
+            if faltan:
+                for fecha, id_, ini, fin in cargar_rango(min(faltan), max(faltan)):
+                    if fecha in faltan: faltan[fecha].append((ini, fin, id_))
+                for fecha, entradas in faltan.items():
+                    self._guardar(fecha, sorted(entradas))
+                    resultado[fecha] = self._dias[fecha]
+        return {d: (resultado[d][3], fusionar((ini, fin) for ini, fin, _ in resultado[d][0])) for d in dias}
+
+    # Aplica una escritura propia. Solo es válido si nadie más escribió entre
+    # `antes` y `despues`; si no, se descarta el índice y se recarga a demanda.
+    # La versión nueva se anota solo después de actualizar los días.
+    def aplicar(self, antes, despues, agregar=(), quitar=()):
+        with self._lock:
+            if self._version != antes:
+                self._sincronizar(despues)
+                return
+            try:
+                for fecha, id_ in quitar:
+                    if fecha in self._dias:
+                        self._guardar(fecha, [e for e in self._dias[fecha][0] if e[2] != id_])
+                for fecha, id_, ini, fin in agregar:
+                    if fecha in self._dias:
+                        entradas = list(self._dias[fecha][0])
+                        insort(entradas, (ini, fin, id_))
+                        self._guardar(fecha, entradas)
+            except BaseException:
+                # Nada a medio aplicar puede quedar atado a una versión: se
+                # descarta todo y se recarga de la base a demanda.
+                self._dias.clear()
+                self._version = None
+                raise
+            self._version = despues
@@ -0,0 +1,80 @@
+import atexit
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import pytest
+
+# Antes de importar db/app: la base y la caché de cartas por defecto van a una
+# carpeta temporal, nunca al repo ni a la DATABASE_URL del entorno.
+_TMP = tempfile.mkdtemp(prefix='pruebas_reservalab_')
+atexit.register(shutil.rmtree, _TMP, ignore_errors=True)
+os.environ.pop('DATABASE_URL', None)
+os.environ['DB_PATH'] = os.path.join(_TMP, 'app.db')
+os.environ['CARTAS_CACHE_DIR'] = os.path.join(_TMP, 'cartas')
+os.environ['CARTAS_PROCESOS'] = '0'
+
+import db
+import motores
+
+# Las pruebas de la base corren contra los dos motores. SQLite siempre, con un
+# archivo nuevo por prueba. PostgreSQL con TEST_DATABASE_URL (una base
+# descartable: las pruebas borran sus tablas) o, si initdb y pg_ctl están en el
+# PATH, con un servidor temporal que se levanta una vez por sesión. Sin
+# ninguno de los dos, o sin psycopg2, esas variantes se saltan.
+@pytest.fixture(scope='session')
+def url_postgres(tmp_path_factory):
+    pytest.importorskip('psycopg2')
+    url = os.environ.get('TEST_DATABASE_URL')
+    if url:
+        yield url
+        return
+    if not (shutil.which('initdb') and shutil.which('pg_ctl')): pytest.skip('sin TEST_DATABASE_URL ni initdb/pg_ctl')
+    if os.geteuid() == 0: pytest.skip('PostgreSQL no arranca como root; usar TEST_DATABASE_URL')
+    carpeta = tmp_path_factory.mktemp('pg')
+    datos = carpeta / 'datos'
+    subprocess.run(['initdb', '-D', str(datos), '-A', 'trust', '-U', 'postgres', '-E', 'UTF8', '--no-locale'], check=True, capture_output=True)
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0)); puerto = s.getsockname()[1]
+    subprocess.run(['pg_ctl', '-D', str(datos), '-l', str(carpeta / 'log'), '-w', 'start',
+                    '-o', f"-p {puerto} -k {carpeta} -c listen_addresses=''"], check=True, capture_output=True)
+    try:
+        yield f'postgresql://postgres@/postgres?host={carpeta}&port={puerto}'
+    finally:
+        subprocess.run(['pg_ctl', '-D', str(datos), '-m', 'immediate', 'stop'], capture_output=True)
+
+def _vaciar_postgres(url):
+    conn = motores.crear_motor(url).conectar()
+    try:
+        conn.execute('DROP TABLE IF EXISTS reservas_laboratorio, version_datos, esquema CASCADE')
+        conn.execute('DROP FUNCTION IF EXISTS fn_version_datos() CASCADE')
+    finally:
+        conn.close()
+
+# Deja db.py apuntando a una base vacía con el esquema al día y devuelve su URL.
+@pytest.fixture(params=['sqlite', 'postgresql'])
+def base(request, tmp_path):
+    if request.param == 'sqlite':
+        url = str(tmp_path / 'prueba.db')
+    else:
+        url = request.getfixturevalue('url_postgres')
+        db.cerrar_conexion()
+        _vaciar_postgres(url)
+    db.usar(url)
+    db.inicializar_db()
+    yield url
+    db.cerrar_conexion()
+
+# Cliente de la app sobre `base`, con la caché del calendario vacía (las
+# versiones de datos se repiten entre bases de distintas pruebas).
+@pytest.fixture
+def cliente(base, monkeypatch):
+    import app
+    monkeypatch.setattr(app, 'cache_calendario', app.CacheTTL())
+    return app.app.test_client()
+
+@pytest.fixture
+def director(cliente):
+    with cliente.session_transaction() as s: s['admin_logueado'] = True
+    return cliente
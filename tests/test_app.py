@@ -0,0 +1,77 @@
+from datetime import date, timedelta
+import pytest
+import db
+
+FECHA = (date.today() + timedelta(days=10)).isoformat()
+
+def _reservar(cliente, inicio='10:00', fin='11:00', fecha=FECHA):
+    return cliente.post('/reservar', data={
+        'nombre': 'Ana', 'registro': '1', 'ci': '1', 'celular': '1', 'email': 'ana@uagrm.bo',
+        'tipo_actividad': 'Taller', 'objetivo': 'Práctica', 'participantes': '3',
+        'fecha': fecha, 'inicio': inicio, 'fin': fin,
+    })
+
+def _ids():
+    return [f['id'] for f in db.consultar('SELECT id FROM reservas_laboratorio ORDER BY id')]
+
+# --- /procesar_reserva ---
+@pytest.mark.parametrize('cuerpo', [
+    {'ids': [1]},                           # sin acción
+    {'accion': 'aprobar', 'ids': [1]},
+    {'accion': 'Rechazr', 'ids': [1]},
+    {'accion': 'Rechazar', 'ids': '1'},     # texto, no lista
+    {'accion': 'Rechazar', 'ids': {'1': 1}},
+    [1, 2],                                 # JSON que no es un objeto
+])
+def test_procesar_rechaza_entradas_invalidas(director, cuerpo):
+    _reservar(director)
+    assert director.post('/procesar_reserva', json=cuerpo).status_code == 400
+    assert db.obtener_reserva(1)['estado'] == 'Pendiente'
+
+def test_procesar_rechaza_json_mal_formado_y_formulario_sin_accion(director):
+    _reservar(director)
+    assert director.post('/procesar_reserva', data='{', content_type='application/json').status_code == 400
+    assert director.post('/procesar_reserva', data={'id': '1'}).status_code == 400
+    assert db.obtener_reserva(1)['estado'] == 'Pendiente'
+
+def test_procesar_json_y_formulario(director):
+    for inicio, fin in (('08:00', '09:00'), ('10:00', '11:00'), ('12:00', '13:00')): _reservar(director, inicio, fin)
+    assert director.post('/procesar_reserva', json={'accion': 'Rechazar', 'ids': [1]}).get_json()['rechazadas'] == [1]
+    assert director.post('/procesar_reserva', json={'accion': 'Aprobar', 'fecha': FECHA}).get_json()['aprobadas'] == [2, 3]
+    r = director.post('/procesar_reserva', data={'accion': 'Aprobar', 'id': '1'})
+    assert r.status_code == 302 and db.obtener_reserva(1)['estado'] == 'Aprobada'
+
+def test_procesar_exige_sesion(cliente):
+    assert cliente.post('/procesar_reserva', json={'accion': 'Rechazar', 'ids': [1]}).status_code == 302
+
+# --- CALENDARIO CONDICIONAL ---
+def test_calendario_304_hasta_que_hay_una_escritura(cliente):
+    r = cliente.get('/reservalab')
+    assert r.status_code == 200 and r.headers.get('Last-Modified') is None
+    etag = r.headers['ETag']
+    assert cliente.get('/reservalab', headers={'If-None-Match': etag}).status_code == 304
+
+    _reservar(cliente)  # en el mismo segundo que la respuesta anterior
+    r = cliente.get('/reservalab', headers={'If-None-Match': etag})
+    assert r.status_code == 200 and r.headers['ETag'] != etag
+    assert cliente.get('/reservalab', headers={'If-None-Match': r.headers['ETag']}).status_code == 304
+
+def test_calendario_ignora_if_modified_since(cliente):
+    r = cliente.get('/api/calendario?ventana=mes')
+    assert cliente.get('/api/calendario?ventana=mes', headers={'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'}).status_code == 200
+    # Otra ventana u otra sesión es otro ETag.
+    assert cliente.get('/api/calendario?ventana=semana', headers={'If-None-Match': r.headers['ETag']}).status_code == 200
+    with cliente.session_transaction() as s: s['admin_logueado'] = True
+    assert cliente.get('/api/calendario?ventana=mes', headers={'If-None-Match': r.headers['ETag']}).status_code == 200
+
+# --- /reservar ---
+@pytest.mark.parametrize('inicio, fin, fecha', [('9:00', '9:30', FECHA), ('09:00', '9:30', FECHA), ('09:00', '10:00', '2030-1-5'), ('09:00', '24:00', FECHA), ('x', 'y', FECHA)])
+def test_reservar_valida_formatos(cliente, inicio, fin, fecha):
+    assert _reservar(cliente, inicio, fin, fecha).status_code == 400
+    assert _ids() == []
+
+def test_reservar_y_cruce(cliente):
+    assert _reservar(cliente, '09:00', '09:30').status_code == 200
+    assert b'ocupado' in _reservar(cliente, '09:10', '09:20').data
+    assert _reservar(cliente, '09:30', '10:00').status_code == 200
+    assert _ids() == [1, 2]
@@ -0,0 +1,27 @@
+import os
+import cartas
+
+def test_cache_recorre_el_directorio_solo_al_pasar_el_limite(tmp_path, monkeypatch):
+    cache = cartas.CachePDF(str(tmp_path), max_bytes=250)
+    recorridos = []
+    archivos = cache._archivos
+    monkeypatch.setattr(cache, '_archivos', lambda: recorridos.append(1) or archivos())
+
+    for i in range(2): cache.guardar(f'c{i}', b'x' * 100)
+    cache.guardar('c0', b'x' * 100)  # reescribir una clave no suma
+    assert recorridos == [] and cache._total == 200
+    os.utime(tmp_path / 'c0.pdf', (1, 1))  # la menos usada
+
+    cache.guardar('c2', b'x' * 100)
+    assert recorridos == [1] and cache._total == 200
+    assert sorted(os.listdir(tmp_path)) == ['c1.pdf', 'c2.pdf']
+    assert cache.leer('c0') is None and cache.leer('c2') == b'x' * 100
+
+def test_carta_se_genera_una_vez(tmp_path, monkeypatch):
+    monkeypatch.setattr(cartas, 'CARTAS_PROCESOS', 0)
+    cache = cartas.CachePDF(str(tmp_path), max_bytes=10 ** 6)
+    datos = cartas.datos_carta({campo: '1' for campo in cartas.CAMPOS_CARTA})
+    pdf = cache.carta(datos)
+    assert pdf.startswith(b'%PDF')
+    monkeypatch.setattr(cartas, 'generar_carta', lambda datos: 1 / 0)
+    assert cache.carta(datos) == pdf
@@ -0,0 +1,144 @@
+import sqlite3
+import pytest
+import db
+import migrar
+import motores
+
+FECHA = '2027-03-01'
+
+def _valores(fecha=FECHA, ini='10:00', fin='11:00', nombre='Ana', tipo='Taller'):
+    return (nombre, '123', '456', '700', 'ana@uagrm.bo', nombre, tipo, 'Práctica', fecha, ini, fin, 3)
+
+def _estado(id_reserva):
+    return db.obtener_reserva(id_reserva)['estado']
+
+# --- RESERVAS ---
+def test_reservar_si_libre_rechaza_cruces(base):
+    a = db.reservar_si_libre(_valores())
+    assert a is not None
+    assert db.reservar_si_libre(_valores(ini='10:30', fin='11:30')) is None
+    assert db.reservar_si_libre(_valores(ini='11:00', fin='12:00')) is not None  # contigua
+    assert db.hay_cruce(FECHA, '10:59', '11:01')
+    assert not db.hay_cruce('2027-03-02', '10:00', '11:00')
+    fila = db.obtener_reserva(a)
+    assert (fila['nombre'], fila['estado'], fila['participantes']) == ('Ana', 'Pendiente', 3)
+
+def test_ocupacion_sigue_las_escrituras(base):
+    a = db.reservar_si_libre(_valores(ini='10:00', fin='10:20'))
+    mapa, ocupado = db.ocupacion(FECHA, FECHA)[FECHA]
+    assert ocupado == [('10:00', '10:20')] and mapa
+    db.procesar_lote(rechazar=[a])
+    assert db.ocupacion(FECHA, FECHA)[FECHA] == (0, [])
+    assert db.reservar_si_libre(_valores(ini='10:20', fin='11:00')) is not None
+
+# --- TRANSACCIONES ---
+class _CommitFalla:
+    def __init__(self, conn): self.conn = conn
+    def execute(self, sql, params=()):
+        if sql == 'COMMIT': raise RuntimeError('COMMIT falló')
+        return self.conn.execute(sql, params)
+
+def test_commit_fallido_no_deja_la_transaccion_abierta(base, monkeypatch):
+    conn = db.obtener_conexion()
+    monkeypatch.setattr(db, 'obtener_conexion', lambda: _CommitFalla(conn))
+    with pytest.raises(RuntimeError):
+        with db.transaccion(inmediata=True) as c: c.execute(db.SQL_INSERTAR, _valores())
+    monkeypatch.undo()
+    # La inserción se deshizo y la conexión del hilo sigue sirviendo.
+    assert db.reservar_si_libre(_valores()) is not None
+    assert db.consultar_uno('SELECT COUNT(*) FROM reservas_laboratorio')[0] == 1
+
+# --- LOTES DEL DIRECTOR ---
+def test_procesar_lote(base):
+    a = db.reservar_si_libre(_valores(ini='10:00', fin='11:00'))
+    assert db.procesar_lote(rechazar=[a])['rechazadas'] == [a]
+    b = db.reservar_si_libre(_valores(ini='10:30', fin='11:30'))  # libre: `a` está rechazada
+    c = db.reservar_si_libre(_valores(ini='12:00', fin='13:00'))
+
+    # Aprobar `a` de nuevo rechaza sola a la pendiente que se le cruza.
+    res = db.procesar_lote(aprobar=[a])
+    assert (res['aprobadas'], res['auto_rechazadas']) == ([a], [b])
+    # `b` choca con una aprobada: se omite.
+    assert db.procesar_lote(aprobar=[b])['omitidas'] == [b]
+    # Con fecha se aprueban las pendientes del día.
+    assert db.procesar_lote(fecha=FECHA)['aprobadas'] == [c]
+    assert [_estado(i) for i in (a, b, c)] == ['Aprobada', 'Rechazada', 'Aprobada']
+    assert db.procesar_lote(rechazar=[9999]) == {'aprobadas': [], 'rechazadas': [], 'auto_rechazadas': [], 'omitidas': []}
+
+# --- LISTADOS ---
+def test_listar_calendario_por_clave(base):
+    ids = [db.reservar_si_libre(_valores(fecha=f'2027-03-0{d}', ini=f'{h}:00', fin=f'{h}:30')) for d in (1, 2) for h in (10, 11, 12)]
+    db.procesar_lote(rechazar=[ids[1]])
+    vistos, despues = [], None
+    while True:
+        filas, despues = db.listar_calendario('2027-03-01', '2027-03-31', despues, limite=2)
+        vistos += [f['id'] for f in filas]
+        if despues is None: break
+    assert vistos == [i for i in ids if i != ids[1]]
+    assert [f['id'] for f in db.listar_calendario('2027-03-02', '2027-03-02')[0]] == ids[3:]
+
+def test_listar_pendientes_y_conteos(base):
+    ids = [db.reservar_si_libre(_valores(fecha=f'2027-03-0{d}', ini=f'{h}:00', fin=f'{h}:30', tipo=t))
+           for d, h, t in ((1, 10, 'Taller'), (1, 11, 'Seminario'), (2, 10, 'Taller'), (3, 10, 'Taller'))]
+    db.procesar_lote(aprobar=[ids[0]])
+
+    filas, siguiente = db.listar_pendientes(limite=2)
+    assert [f['id'] for f in filas] == ids[1:3]
+    filas, siguiente = db.listar_pendientes(siguiente, limite=2)
+    assert [f['id'] for f in filas] == ids[3:] and siguiente is None
+    assert [f['id'] for f in db.listar_pendientes(orden='desc')[0]] == ids[:0:-1]
+    assert [f['id'] for f in db.listar_pendientes(tipo_actividad='Taller', desde='2027-03-02')[0]] == ids[2:]
+
+    por_dia, por_tipo = db.conteos_pendientes()
+    assert [(f['fecha'], f['n']) for f in por_dia] == [('2027-03-01', 1), ('2027-03-02', 1), ('2027-03-03', 1)]
+    assert [(f['tipo_actividad'], f['n']) for f in por_tipo] == [('Taller', 2), ('Seminario', 1)]
+
+def test_reporte_por_lotes(base):
+    ids = [db.reservar_si_libre(_valores(ini=f'{h:02d}:00', fin=f'{h:02d}:30')) for h in range(8, 15)]
+    db.procesar_lote(rechazar=ids[:2])
+    columnas, lotes = db.reporte(tam=3)
+    lotes = list(lotes)
+    assert columnas[0] == 'id' and 'estado' in columnas
+    assert [len(l) for l in lotes] == [3, 3, 1]
+    assert [f[0] for l in lotes for f in l] == ids
+    _, lotes = db.reporte(tam=3, estado='Rechazada')
+    assert [f['id'] for l in lotes for f in l] == ids[:2]
+
+# --- MIGRACIÓN ---
+def _origen_sqlite(ruta, n):
+    db.usar(str(ruta))
+    db.inicializar_db()
+    ids = [db.reservar_si_libre(_valores(ini=f'{h:02d}:00', fin=f'{h:02d}:30', nombre=f'Persona {h}')) for h in range(8, 8 + n)]
+    db.procesar_lote(rechazar=ids[:1], aprobar=ids[1:2])
+    db.cerrar_conexion()
+    # Modo de diario por defecto, para comprobar que la migración no lo toca.
+    conn = sqlite3.connect(ruta); conn.execute('PRAGMA journal_mode=DELETE'); conn.close()
+
+def _filas(url):
+    conn = motores.crear_motor(url).conectar_lectura()
+    try: return [tuple(f) for f in conn.execute('SELECT * FROM reservas_laboratorio ORDER BY id').fetchall()]
+    finally: conn.close()
+
+def test_migrar(base, tmp_path):
+    origen = tmp_path / 'origen.db'
+    _origen_sqlite(origen, 5)
+    assert migrar.migrar(str(origen), base, tam=2) == (5, 5)
+    assert migrar.migrar(str(origen), base, tam=2) == (5, 5)  # se puede repetir
+    assert _filas(base) == _filas(str(origen))
+
+    # El origen sigue igual y la secuencia de ids del destino sigue a la copia.
+    conn = sqlite3.connect(origen)
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'delete'
+    conn.close()
+    db.usar(base)
+    assert db.reservar_si_libre(_valores(ini='20:00', fin='21:00')) == 6
+
+    # Y de vuelta, leyendo del motor bajo prueba.
+    copia = str(tmp_path / 'copia.db')
+    assert migrar.migrar(base, copia, tam=4) == (6, 6)
+    assert _filas(copia) == _filas(base)
+
+def test_migrar_origen_inexistente(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        migrar.migrar(str(tmp_path / 'no_existe.db'), str(tmp_path / 'destino.db'))
+    assert not (tmp_path / 'no_existe.db').exists()
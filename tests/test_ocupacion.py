@@ -0,0 +1,27 @@
+import pytest
+from ocupacion import IndiceIntervalos, fusionar, horarios_libres, mascara
+
+def test_libres_exactos():
+    ocupados = fusionar([('10:00', '10:20'), ('10:20', '11:00'), ('12:00', '12:30')])
+    assert ocupados == [('10:00', '11:00'), ('12:00', '12:30')]
+    assert horarios_libres(ocupados) == [('00:00', '10:00'), ('11:00', '12:00'), ('12:30', '24:00')]
+    assert mascara('10:00', '10:20') == 0b11 << 40
+
+def test_aplicar_fallido_descarta_el_indice():
+    filas = {'2027-03-01': [(1, '10:00', '11:00')]}
+    cargar = lambda fecha: filas.get(fecha, [])
+    indice = IndiceIntervalos()
+    assert indice.cruce(1, '2027-03-01', '10:30', '10:45', cargar)
+
+    # Una hora mal formada no puede dejar la versión nueva con el día sin la fila.
+    filas['2027-03-01'].append((2, '9:00', '9:30'))
+    with pytest.raises(ValueError):
+        indice.aplicar(1, 2, agregar=[('2027-03-01', 2, '9:00', '9:30')])
+    filas['2027-03-01'][1] = (2, '09:00', '09:30')
+    assert indice.cruce(2, '2027-03-01', '09:10', '09:20', cargar)
+
+def test_aplicar_actualiza_sin_recargar():
+    indice = IndiceIntervalos()
+    assert not indice.cruce(1, '2027-03-01', '10:00', '11:00', lambda f: [])
+    indice.aplicar(1, 2, agregar=[('2027-03-01', 7, '10:00', '11:00')])
+    assert indice.cruce(2, '2027-03-01', '10:30', '10:45', lambda f: pytest.fail('no debe recargar'))